@@ -0,0 +1,45 @@
+from rest_framework import status
+from rest_framework.response import Response
+
+from utils import exception
+from utils.asyncviews import AsyncAPIViewMixin
+from utils.cache import CATALOG_CACHE, acache_response
+from utils.conditional import aconditional_response
+from utils.db.aio import get_database
+from .serializers import GetDetailCourseSerializer
+from .views import GetAllCourseView, DetailCourseView
+
+
+class AsyncGetAllCourseView(AsyncAPIViewMixin, GetAllCourseView):
+
+    @aconditional_response
+    @acache_response(CATALOG_CACHE)
+    async def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(await get_database(queryset.db).fetch(queryset), many=True)
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+
+class AsyncDetailCourseView(AsyncAPIViewMixin, DetailCourseView):
+
+    async def aget_object(self):
+        pk = self.kwargs['id']
+        queryset = self.get_queryset().filter(pk=pk)
+        data = await get_database(queryset.db).fetch(queryset)
+        if len(data) < 1:
+            raise exception.DoesNotExist(
+                detail=f"course with id {pk} does not exist")
+        return data
+
+    @aconditional_response
+    @acache_response(CATALOG_CACHE)
+    async def get(self, request, *args, **kwargs):
+        item = await self.aget_object()
+        serializer = GetDetailCourseSerializer(item, many=True)
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
@@ -1,6 +1,13 @@
 from django_filters import rest_framework as filters
+from utils import constant, exception
 from .models import CourseModel
 
+COURSE_TYPES = {option for option, _ in constant.COURSE_TYPE_OPTION}
+
+
+class NumberCSVFilter(filters.BaseCSVFilter, filters.NumberFilter):
+    pass
+
 
 class CourseFilter(filters.FilterSet):
     old_price = filters.NumberFilter(field_name='old_price',lookup_expr='contains')
@@ -9,7 +16,10 @@ class CourseFilter(filters.FilterSet):
     description = filters.CharFilter(field_name='description', lookup_expr='contains')
     title = filters.CharFilter(field_name='title', lookup_expr='contains')
     user = filters.CharFilter(field_name='user_id', lookup_expr='exact')
-    type = filters.CharFilter(lookup_expr='icontains')
+    # ?type=3,5 any of the types, ?type_all=3,5 all of them
+    type = NumberCSVFilter(method='type_any_filter')
+    type_all = NumberCSVFilter(method='type_all_filter')
+    search = filters.CharFilter(method='search_filter')
 
     class Meta:
         model = CourseModel
@@ -23,5 +33,20 @@ class CourseFilter(filters.FilterSet):
             'type',
         }
 
-    def type_filter(self, queryset, name, value):
-        return queryset.filter(type=value)
+    def clean_types(self, value):
+        types = [item for item in value if item is not None]
+        invalid = [str(item) for item in types if item not in COURSE_TYPES]
+        if invalid:
+            raise exception.FormatErrorValue(detail=f"type {', '.join(invalid)} does not exist")
+        return [int(item) for item in types]
+
+    def type_any_filter(self, queryset, name, value):
+        types = self.clean_types(value)
+        return queryset.in_any_type(types) if types else queryset
+
+    def type_all_filter(self, queryset, name, value):
+        types = self.clean_types(value)
+        return queryset.in_all_types(types) if types else queryset
+
+    def search_filter(self, queryset, name, value):
+        return queryset.search(value)
@@ -0,0 +1,142 @@
+import collections
+import csv
+import hashlib
+import hmac
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from utils.db.copy import copy_rows
+from utils.ids import build_uuid7
+from .models import KeyActiveModel
+
+# keys created with every new course
+COURSE_INITIAL_KEYS = 10
+
+# rows written to the CSV per chunk of the streamed response
+CSV_CHUNK_ROWS = 1000
+
+# The claim and the read of the course are one statement. The main query
+# sees tbl_key_active as it was before the DELETE, hence the - 1, and
+# counts at most KEY_POOL_LOW_WATERMARK + 1 keys whatever the pool size.
+REDEEM_SQL = """
+WITH claimed AS (
+    DELETE FROM tbl_key_active WHERE key_active = %s RETURNING course_id
+)
+SELECT c.id, c.title, (
+    SELECT COUNT(*) FROM (
+        SELECT 1 FROM tbl_key_active k WHERE k.course_id = c.id LIMIT %s
+    ) pool
+) - 1
+FROM claimed JOIN tbl_course c ON c.id = claimed.course_id
+"""
+
+# first half of the advisory lock key of a course refill, the course id is the second
+REFILL_LOCK = 19001
+
+POOL_SIZE_SQL = """
+SELECT COUNT(*) FROM (SELECT 1 FROM tbl_key_active WHERE course_id = %s LIMIT %s) pool
+"""
+
+Redemption = collections.namedtuple('Redemption', ('course_id', 'title', 'remaining'))
+
+
+def new_seed():
+    """Seed of an issue: its time in ms, so the keys sort after older ones, and 10 random bytes."""
+    return (time.time_ns() // 1000000).to_bytes(6, 'big') + os.urandom(10)
+
+
+def generate_keys(seed, count):
+    """
+    The count keys of an issue, derived from its seed with HMAC-SHA256 so
+    they can be produced again for the CSV instead of being kept in
+    memory. Version 7 UUIDs stamped with the issue time, with 74 secret
+    bits each.
+    """
+    secret = settings.SECRET_KEY.encode('utf-8')
+    milliseconds = int.from_bytes(seed[:6], 'big')
+    for index in range(count):
+        digest = hmac.new(secret, seed + index.to_bytes(8, 'big'), hashlib.sha256).digest()
+        yield build_uuid7(milliseconds, int.from_bytes(digest[:10], 'big'))
+
+
+def issue_keys(course_id, count):
+    """
+    Insert count activation keys for a course in one round trip, a
+    bulk_create up to KEY_ISSUE_BULK_CREATE_MAX keys, a COPY streamed from
+    the generator above it. Returns the seed the keys can be regenerated from.
+    """
+    seed = new_seed()
+    now = timezone.now()
+    with transaction.atomic():
+        if count <= settings.KEY_ISSUE_BULK_CREATE_MAX:
+            KeyActiveModel.objects.bulk_create([
+                KeyActiveModel(key_active=key, course_id=course_id, created_at=now, updated_at=now)
+                for key in generate_keys(seed, count)
+            ])
+        else:
+            copy_rows(KeyActiveModel._meta.db_table,
+                      ('key_active', 'course_id', 'created_at', 'updated_at', 'deleted'),
+                      ((key, course_id, now, now, False) for key in generate_keys(seed, count)))
+    return seed
+
+
+def redeem_key(key):
+    """
+    Claim an activation key, exactly once however many requests race for
+    it: a concurrent DELETE of the same row waits for the first one and
+    then finds nothing. Returns a Redemption, None for an unknown or
+    already used key. The pool of the course is topped up in batches when
+    it runs low, not one key per redemption.
+    """
+    try:
+        key = uuid.UUID(str(key))
+    except ValueError:
+        return None
+    connection = connections[router.db_for_write(KeyActiveModel)]
+    with connection.cursor() as cursor:
+        cursor.execute(REDEEM_SQL, [key, settings.KEY_POOL_LOW_WATERMARK + 1])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    redemption = Redemption(*row)
+    if redemption.remaining < settings.KEY_POOL_LOW_WATERMARK:
+        refill_pool(redemption.course_id, using=connection.alias)
+    return redemption
+
+
+def refill_pool(course_id, using):
+    """
+    Top up the keys of a course. Skipped when another redemption holds the
+    refill lock, or has just refilled the pool.
+    """
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s, %s)', [REFILL_LOCK, course_id])
+        if not cursor.fetchone()[0]:
+            return
+        cursor.execute(POOL_SIZE_SQL, [course_id, settings.KEY_POOL_LOW_WATERMARK])
+        if cursor.fetchone()[0] >= settings.KEY_POOL_LOW_WATERMARK:
+            return
+        issue_keys(course_id, settings.KEY_POOL_REFILL)
+
+
+class _Echo(object):
+    def write(self, value):
+        return value
+
+
+def stream_keys_csv(course_id, seed, count):
+    """CSV lines of an issue, in chunks, for a StreamingHttpResponse."""
+    writer = csv.writer(_Echo())
+    chunk = [writer.writerow(('key_active', 'course_id'))]
+    for key in generate_keys(seed, count):
+        chunk.append(writer.writerow((key, course_id)))
+        if len(chunk) >= CSV_CHUNK_ROWS:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import threading
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+
+# (name, sync path, async path, method, body)
+ENDPOINTS = (
+    ('list', '/course/list', '/course/async/list', 'GET', None),
+    ('detail', '/course/list/{id}', '/course/async/list/{id}', 'GET', None),
+    ('check-email', '/user/check-email-exist', '/user/async/check-email-exist', 'POST',
+     {'email': 'bench@example.com'}),
+)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+class Command(BaseCommand):
+    help = ('Fire concurrent requests at the sync and async versions of the catalog reads '
+            'through the ASGI application, in process.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default='list,check-email',
+                            help='Comma separated: list, detail, check-email.')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and version.')
+        parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight at once.')
+        parser.add_argument('--course-id', type=int, default=1, help='Course of the detail endpoint.')
+        parser.add_argument('--token', help='Access token of a lecturer or admin, required by detail.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        names = options['endpoints'].split(',')
+        unknown = set(names) - {endpoint[0] for endpoint in ENDPOINTS}
+        if unknown:
+            raise CommandError('Unknown endpoint(s) %s' % ', '.join(sorted(unknown)))
+        if 'detail' in names and not options['token']:
+            raise CommandError('detail needs --token')
+
+        application = get_asgi_application()
+        results = []
+        for name, sync_path, async_path, method, body in ENDPOINTS:
+            if name not in names:
+                continue
+            for version, path in (('sync', sync_path), ('async', async_path)):
+                result = asyncio.run(self.run(application, path.format(id=options['course_id']),
+                                              method, body, options))
+                result.update(endpoint=name, version=version)
+                results.append(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write('%-12s %-6s %9s %9s %9s %8s %7s' % (
+            'endpoint', 'view', 'req/s', 'p50 ms', 'p95 ms', 'threads', 'errors'))
+        for row in results:
+            self.stdout.write('%-12s %-6s %9.0f %9.2f %9.2f %8s %7s' % (
+                row['endpoint'], row['version'], row['throughput'], row['p50_ms'], row['p95_ms'],
+                row['peak_threads'], row['errors']))
+
+    async def run(self, application, path, method, body, options):
+        payload = json.dumps(body).encode() if body is not None else b''
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]
+        if options['token']:
+            headers.append((b'authorization', ('Bearer %s' % options['token']).encode()))
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+            'headers': headers, 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+        }
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        statuses = []
+        peak_threads = threading.active_count()
+        done = False
+
+        async def sample_threads():
+            nonlocal peak_threads
+            while not done:
+                peak_threads = max(peak_threads, threading.active_count())
+                await asyncio.sleep(0.01)
+
+        async def request():
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            async with semaphore:
+                started = time.perf_counter()
+                await application(dict(scope), receive, send)
+                latencies.append(time.perf_counter() - started)
+            statuses.append(messages[0]['status'])
+
+        sampler = asyncio.ensure_future(sample_threads())
+        started = time.perf_counter()
+        await asyncio.gather(*[request() for _ in range(options['requests'])])
+        elapsed = time.perf_counter() - started
+        done = True
+        await sampler
+
+        return {
+            'requests': len(latencies),
+            'seconds': elapsed,
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'peak_threads': peak_threads,
+            'errors': sum(1 for status in statuses if status >= 400),
+        }
@@ -0,0 +1,283 @@
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import Client, override_settings
+from django.urls import Resolver404, resolve
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from course.management.commands.seed_catalog import BENCH_EMAIL_DOMAIN, BENCH_PASSWORD
+from course.models import CourseModel, KeyActiveModel
+from users.models import User
+from utils import constant
+from utils.cache import CATALOG_CACHE, bump_version
+
+# (name, method, path, needs) where needs lists the fixtures the request is built from
+SCENARIOS = (
+    ('list', 'GET', '/course/list', ()),
+    ('list-keyset', 'GET', '/course/list?cursor=', ()),
+    ('list-type', 'GET', '/course/list?type={type}', ('type',)),
+    ('list-type-all', 'GET', '/course/list?type_all={type},{second_type}', ('type',)),
+    ('list-search', 'GET', '/course/list?search=lap+trinh', ()),
+    ('list-title', 'GET', '/course/list?title=python', ()),
+    ('list-price', 'GET', '/course/list?new_price=99', ()),
+    ('list-user', 'GET', '/course/list?user={lecturer_id}', ('lecturer',)),
+    ('detail', 'GET', '/course/list/{course_id}', ('lecturer',)),
+    ('list-owner', 'GET', '/course/list-owner', ('lecturer',)),
+    ('login', 'POST', '/user/login', ('lecturer',)),
+    ('refresh', 'POST', '/user/api/token/refresh/', ('lecturer',)),
+    ('activate', 'POST', '/course/activate', ('keys',)),
+)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(settings.BASE_DIR),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class QueryCounter(object):
+    """Execute wrapper counting statements on every database alias."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('Time the main course and user endpoints in process through the test client and '
+            'report p50/p95 latency, queries and peak memory per request as JSON. '
+            'Expects a catalog seeded by seed_catalog.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(scenario[0] for scenario in SCENARIOS),
+                            help='Comma separated scenario names.')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario.')
+        parser.add_argument('--memory-requests', type=int, default=5,
+                            help='Requests traced with tracemalloc for the peak memory, after the timed ones.')
+        parser.add_argument('--cold', action='store_true',
+                            help='Invalidate the catalog cache before every request.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--compare', help='Print the p50/p95 change against an earlier JSON report.')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'].split(',')
+        unknown = set(names) - {scenario[0] for scenario in SCENARIOS}
+        if unknown:
+            raise CommandError('Unknown scenario(s) %s' % ', '.join(sorted(unknown)))
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+
+        # a failing endpoint is reported in the statuses, not raised
+        self.client = Client(raise_request_exception=False)
+        fixtures = self.load_fixtures(names, options)
+        results = []
+        # every request comes from the same address and user, flood_endpoints measures the throttles
+        with override_settings(THROTTLE_ENABLED=False):
+            for name, method, path, needs in SCENARIOS:
+                if name in names:
+                    results.append(self.run(name, method, path, fixtures, options))
+
+        report = {
+            'revision': git_revision(),
+            'date': datetime.datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'settings': {
+                'pool_mode': getattr(settings, 'DATABASE_POOL_MODE', None),
+                'renderer_backend': getattr(settings, 'JSON_RENDERER_BACKEND', None),
+                'replicas': [alias for alias in settings.DATABASES if alias != 'default'],
+                'cold': options['cold'],
+            },
+            'rows': {
+                'courses': CourseModel.objects.count(),
+                'users': User.objects.count(),
+                'keys': KeyActiveModel.objects.count(),
+            },
+            'scenarios': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            self.compare(report, options['compare'])
+        over = [scenario['name'] for scenario in results if scenario['over_budget']]
+        if over:
+            raise CommandError('Query budget exceeded by %s' % ', '.join(over))
+
+    def load_fixtures(self, names, options):
+        needs = {need for name, method, path, scenario_needs in SCENARIOS if name in names
+                 for need in scenario_needs}
+        fixtures = {}
+        if 'type' in needs:
+            fixtures['type'], fixtures['second_type'] = constant.COURSE_PYTHON, constant.COURSE_DJANGO
+        if 'lecturer' in needs:
+            # seed_catalog gives every user the same password
+            lecturer = User.objects.filter(
+                position=constant.USER_LECTURERS, email__endswith='@' + BENCH_EMAIL_DOMAIN,
+                author_course_user__isnull=False,
+            ).order_by('id').first()
+            if lecturer is None:
+                raise CommandError('No seeded lecturer with courses, run seed_catalog first')
+            # tokens are minted here so the other scenarios do not depend on login
+            refresh = RefreshToken.for_user(lecturer)
+            fixtures.update(
+                lecturer_id=lecturer.id,
+                username=lecturer.username,
+                access=str(refresh.access_token),
+                refresh=str(refresh),
+                course_id=lecturer.author_course_user.order_by('id').values_list('id', flat=True).first(),
+            )
+        if 'keys' in needs:
+            count = options['warmup'] + options['requests'] + options['memory_requests']
+            fixtures['keys'] = [str(key) for key in
+                                KeyActiveModel.objects.values_list('key_active', flat=True)[:count]]
+            if len(fixtures['keys']) < count:
+                raise CommandError('activate needs %s key-active rows, found %s' % (count, len(fixtures['keys'])))
+        return fixtures
+
+    def build_request(self, name, method, path, fixtures, index):
+        path = path.format(**fixtures)
+        data = None
+        if name == 'login':
+            data = {'username': fixtures['username'], 'password': BENCH_PASSWORD}
+        elif name == 'refresh':
+            data = {'refresh': fixtures['refresh']}
+        elif name == 'activate':
+            # every activation consumes its key
+            data = {'key_active': fixtures['keys'][index]}
+        headers = {}
+        if 'access' in fixtures and name in ('detail', 'list-owner'):
+            headers['HTTP_AUTHORIZATION'] = 'Bearer %s' % fixtures['access']
+        return method, path, data, headers
+
+    def request(self, method, path, data, headers):
+        # the test client skips the request_started / request_finished
+        # connection handling of the real handlers
+        close_old_connections()
+        if method == 'GET':
+            response = self.client.get(path, **headers)
+        else:
+            response = self.client.post(path, data, content_type='application/json', **headers)
+        if response.streaming:
+            body = b''.join(response.streaming_content)
+        else:
+            body = response.content
+        close_old_connections()
+        return response.status_code, len(body)
+
+    def run(self, name, method, path, fixtures, options):
+        counter = QueryCounter()
+        latencies = []
+        queries = []
+        statuses = {}
+        size = 0
+        index = 0
+        most_queries = 0
+
+        def call(timed):
+            nonlocal index, size, most_queries
+            request = self.build_request(name, method, path, fixtures, index)
+            index += 1
+            if options['cold']:
+                bump_version(CATALOG_CACHE)
+            counter.count = 0
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(counter))
+                started = time.perf_counter()
+                status, size = self.request(*request)
+                elapsed = time.perf_counter() - started
+            most_queries = max(most_queries, counter.count)
+            if timed:
+                latencies.append(elapsed)
+                queries.append(counter.count)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        for _ in range(options['warmup']):
+            call(timed=False)
+        for _ in range(options['requests']):
+            call(timed=True)
+
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(options['memory_requests']):
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                call(timed=False)
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        finally:
+            tracemalloc.stop()
+
+        budget = self.get_query_budget(path.format(**fixtures))
+        return {
+            'name': name,
+            'method': method,
+            'path': path.format(**fixtures),
+            'requests': len(latencies),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+            'max_ms': round(max(latencies) * 1000, 3),
+            'queries_median': statistics.median(queries),
+            'queries_max': max(queries),
+            'peak_memory_kb': round(max(peaks) / 1024, 1) if peaks else None,
+            'response_bytes': size,
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'query_budget': budget,
+            # warmup requests included, the first one misses the response cache
+            'over_budget': budget is not None and most_queries > budget,
+        }
+
+    def get_query_budget(self, path):
+        try:
+            match = resolve(path.split('?')[0])
+        except Resolver404:
+            return None
+        return getattr(getattr(match.func, 'view_class', None), 'query_budget', None)
+
+    def compare(self, report, path):
+        try:
+            with open(path) as baseline_file:
+                baseline = {scenario['name']: scenario for scenario in json.load(baseline_file)['scenarios']}
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError('Cannot read %s: %s' % (path, error))
+        self.stderr.write('%-14s %10s %10s %8s %10s %10s %8s %8s' % (
+            'scenario', 'p50 before', 'p50 now', 'change', 'p95 before', 'p95 now', 'change', 'queries'))
+        for scenario in report['scenarios']:
+            before = baseline.get(scenario['name'])
+            if before is None:
+                continue
+            self.stderr.write('%-14s %10.2f %10.2f %+7.0f%% %10.2f %10.2f %+7.0f%% %3s -> %s' % (
+                scenario['name'],
+                before['p50_ms'], scenario['p50_ms'], self.change(before['p50_ms'], scenario['p50_ms']),
+                before['p95_ms'], scenario['p95_ms'], self.change(before['p95_ms'], scenario['p95_ms']),
+                before['queries_median'], scenario['queries_median']))
+
+    def change(self, before, now):
+        return (now - before) / before * 100 if before else 0
@@ -0,0 +1,99 @@
+import json
+import random
+import timeit
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from course.models import CourseModel
+from course.serializers import GetAllCourseSerializer
+from users.models import PhotoModel
+from utils import constant
+from utils.renderers import EmberJSONRenderer, orjson
+
+WORDS = ('lập trình', 'python', 'django', 'react', 'cơ bản', 'nâng cao', 'thực chiến', 'web', 'api', 'dữ liệu')
+
+
+def synthetic_courses(size):
+    """Unsaved courses shaped like the catalog listing rows, no database needed."""
+    rng = random.Random(size)
+    types = [code for code, _ in constant.COURSE_TYPE_OPTION]
+    courses = []
+    for index in range(size):
+        course = CourseModel(
+            id=index + 1,
+            title=' '.join(rng.choice(WORDS) for _ in range(6)).capitalize(),
+            description=' '.join(rng.choice(WORDS) for _ in range(60))[:500],
+            new_price=rng.randrange(0, 2000000, 1000),
+            old_price=rng.randrange(0, 3000000, 1000),
+            type=rng.sample(types, rng.randint(1, 3)),
+            status=constant.STATUS_COURSE_IS_NEW,
+            author_username='lecturer%s' % rng.randint(1, 50),
+        )
+        course.photo = PhotoModel(id=index + 1, photo='photos/%s.jpg' % uuid.UUID(int=index), uid=uuid.UUID(int=index))
+        courses.append(course)
+    return courses
+
+
+def database_courses(size):
+    queryset = GetAllCourseSerializer.setup_eager_loading(CourseModel.objects.all())
+    return list(queryset[:size])
+
+
+class Command(BaseCommand):
+    help = 'Compare the stdlib json and orjson backends of EmberJSONRenderer on course list pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000',
+                            help='Comma separated page sizes.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timing runs per measurement, the best one is reported.')
+        parser.add_argument('--source', choices=('synthetic', 'db'), default='synthetic',
+                            help='Serialize in-memory courses or the first rows of tbl_course.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson is not installed, nothing to compare')
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be comma separated integers')
+
+        results = []
+        for size in sizes:
+            courses = synthetic_courses(size) if options['source'] == 'synthetic' else database_courses(size)
+            page = {
+                'links': {'next': None, 'previous': None, 'count': len(courses),
+                          'count_is_approximate': False, 'page_size': size},
+                'data': GetAllCourseSerializer(courses, many=True).data,
+            }
+            results.append(self.measure(size, page, options['repeat']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write('%8s %12s %12s %10s %10s' % ('rows', 'json us', 'orjson us', 'speedup', 'bytes'))
+        for row in results:
+            self.stdout.write('%8s %12.1f %12.1f %9.1fx %10s' % (
+                row['rows'], row['json_us'], row['orjson_us'], row['speedup'], row['bytes']))
+
+    def measure(self, size, page, repeat):
+        timings = {}
+        outputs = {}
+        for backend in ('json', 'orjson'):
+            renderer = EmberJSONRenderer()
+            renderer.backend = backend
+            outputs[backend] = renderer.render(page)
+            number = max(1, 2000 // max(size, 1))
+            best = min(timeit.repeat(lambda: renderer.render(page), number=number, repeat=repeat))
+            timings[backend] = best / number * 1e6
+        if json.loads(outputs['json']) != json.loads(outputs['orjson']):
+            raise CommandError('Backends disagree on a %s row page' % size)
+        return {
+            'rows': size,
+            'json_us': timings['json'],
+            'orjson_us': timings['orjson'],
+            'speedup': timings['json'] / timings['orjson'],
+            'bytes': len(outputs['orjson']),
+        }
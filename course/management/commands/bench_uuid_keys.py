@@ -0,0 +1,83 @@
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from utils.db.copy import copy_rows
+from utils.ids import uuid7
+
+KINDS = {'uuid4': uuid.uuid4, 'uuid7': uuid7}
+
+CREATE_SQL = 'CREATE TABLE {table} (key uuid PRIMARY KEY, course_id integer NOT NULL)'
+
+SIZE_SQL = """
+SELECT pg_relation_size(%s::regclass), pg_relation_size(%s::regclass)
+"""
+
+
+class Command(BaseCommand):
+    help = ('Compare insert throughput and primary key index size of random (v4) and time-ordered (v7) '
+            'UUID keys, in scratch tables shaped like tbl_key_active.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=3000000)
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Rows per COPY, each batch is its own transaction like separate issues.')
+        parser.add_argument('--keep', action='store_true', help='Keep the scratch tables.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--rows and --batch-size must be at least 1')
+        results = []
+        for kind, factory in KINDS.items():
+            table = 'bench_key_%s' % kind
+            try:
+                results.append(self.measure(kind, table, factory, options['rows'], options['batch_size']))
+            finally:
+                if not options['keep']:
+                    with connection.cursor() as cursor:
+                        cursor.execute('DROP TABLE IF EXISTS %s' % table)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write('%-6s %10s %12s %12s %12s' % ('key', 'rows/s', 'index MB', 'table MB', 'last batch s'))
+        for row in results:
+            self.stdout.write('%-6s %10.0f %12.1f %12.1f %12.3f' % (
+                row['kind'], row['rows_per_second'], row['index_mb'], row['table_mb'], row['last_batch_seconds']))
+
+    def measure(self, kind, table, factory, rows, batch_size):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS %s' % table)
+            cursor.execute(CREATE_SQL.format(table=table))
+
+        elapsed = 0.0
+        batch_seconds = 0.0
+        written = 0
+        while written < rows:
+            size = min(batch_size, rows - written)
+            # generated before the clock starts, only the insert is timed
+            batch = [(factory(), written // batch_size) for _ in range(size)]
+            started = time.perf_counter()
+            with transaction.atomic():
+                copy_rows(table, ('key', 'course_id'), batch)
+            batch_seconds = time.perf_counter() - started
+            elapsed += batch_seconds
+            written += size
+
+        with connection.cursor() as cursor:
+            cursor.execute(SIZE_SQL, ['%s_pkey' % table, table])
+            index_size, table_size = cursor.fetchone()
+        return {
+            'kind': kind,
+            'rows': written,
+            'seconds': elapsed,
+            'rows_per_second': written / elapsed,
+            # insert cost once the index no longer fits in cache shows here first
+            'last_batch_seconds': batch_seconds,
+            'index_mb': index_size / 2 ** 20,
+            'table_mb': table_size / 2 ** 20,
+        }
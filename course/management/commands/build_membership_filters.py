@@ -0,0 +1,71 @@
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.bloom import FILTERS
+
+
+class Command(BaseCommand):
+    help = ('Build the bloom filters of the existence checks (user email, course title) from the database '
+            'and report their size, memory and false positive rate. With --probe, the rate is measured '
+            'on random values that are not in the table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filters', default=','.join(FILTERS), help='Comma separated filter names.')
+        parser.add_argument('--reset', action='store_true', help='Only drop the filters, checks rebuild them.')
+        parser.add_argument('--probe', type=int, default=0, help='Absent values probed per filter.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        if settings.BLOOM_BACKEND == 'off':
+            raise CommandError("BLOOM_BACKEND is 'off', there is no filter to build")
+        names = [name for name in options['filters'].split(',') if name]
+        unknown = set(names) - set(FILTERS)
+        if unknown:
+            raise CommandError('Unknown filter(s) %s' % ', '.join(sorted(unknown)))
+
+        results = []
+        for name in names:
+            membership = FILTERS[name]
+            if options['reset']:
+                membership.reset()
+                self.stdout.write('%s: reset' % name)
+                continue
+            started = time.perf_counter()
+            if not membership.build():
+                raise CommandError('%s is being built by another process' % name)
+            data = membership.stats()
+            data['build_seconds'] = round(time.perf_counter() - started, 3)
+            if options['probe']:
+                data.update(self.probe(membership, options['probe']))
+            results.append(data)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for data in results:
+            self.stdout.write('%(name)s (%(backend)s): %(items)s values, capacity %(capacity)s, '
+                              '%(bits)s bits, %(hashes)s hashes, built in %(build_seconds)ss' % data)
+            self.stdout.write('  memory %.1f KB, expected false positive rate %.4f%%' % (
+                data['memory_bytes'] / 1024, data['expected_error_rate'] * 100))
+            if 'probed' in data:
+                self.stdout.write('  measured false positive rate %.4f%% on %s absent values, %.1f us per probe' % (
+                    data['measured_error_rate'] * 100, data['probed'], data['probe_us']))
+
+    def probe(self, membership, count):
+        backend = membership.get_backend()
+        positives = 0
+        started = time.perf_counter()
+        for _ in range(count):
+            # a random UUID is not an email or title anyone saved
+            if backend.probe('probe-%s' % uuid.uuid4().hex):
+                positives += 1
+        elapsed = time.perf_counter() - started
+        return {
+            'probed': count,
+            'measured_error_rate': round(positives / count, 6),
+            'probe_us': round(elapsed / count * 1000000, 1),
+        }
@@ -0,0 +1,102 @@
+import json
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import Client, override_settings
+
+from course.management.commands.bench_endpoints import QueryCounter
+from utils.throttling import get_backend
+
+# name -> (path, body of the n-th request of a run); the same username,
+# email or code is sent again and again, activation codes are all new
+TARGETS = {
+    'login': ('/user/login', lambda run, n: {'username': 'flood-%s' % run, 'password': 'flood'}),
+    'login-no-pass': ('/user/login-no-pass', lambda run, n: {'username': 'flood-%s' % run}),
+    'check-email': ('/user/check-email-exist', lambda run, n: {'email': 'flood-%s@example.com' % run}),
+    'check-discount': ('/course/check-discount', lambda run, n: {'discount': 'FLOOD-%s' % run}),
+    'activate': ('/course/activate', lambda run, n: {'key_active': str(uuid.uuid4())}),
+}
+
+
+class Command(BaseCommand):
+    help = ('Flood the public login, check and activate endpoints through the test client, with the '
+            'throttles off and on, and report the statements run against the database per tenth of '
+            'the flood. With the throttles on, database work stops growing once the buckets are empty.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--targets', default=','.join(TARGETS), help='Comma separated endpoint names.')
+        parser.add_argument('--requests', type=int, default=300, help='Requests per target and mode.')
+        parser.add_argument('--addresses', type=int, default=1,
+                            help='Client addresses the flood rotates through.')
+        parser.add_argument('--backend', choices=('local', 'redis'), default='local')
+        parser.add_argument('--modes', default='off,on', help='Throttles off, on, or both.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        names = [name for name in options['targets'].split(',') if name]
+        unknown = set(names) - set(TARGETS)
+        if unknown:
+            raise CommandError('Unknown target(s) %s' % ', '.join(sorted(unknown)))
+        modes = [mode for mode in options['modes'].split(',') if mode]
+        if set(modes) - {'off', 'on'}:
+            raise CommandError('--modes takes off and on')
+        if options['requests'] < 10 or options['addresses'] < 1:
+            raise CommandError('--requests must be at least 10 and --addresses at least 1')
+
+        self.client = Client(raise_request_exception=False)
+        results = []
+        for name in names:
+            for mode in modes:
+                with override_settings(THROTTLE_ENABLED=mode == 'on', THROTTLE_BACKEND=options['backend']):
+                    results.append(self.flood(name, mode, options))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write('%-15s %-4s %8s %6s %8s %8s  %s' % (
+            'target', 'mode', 'requests', '429', 'queries', 'req/s', 'queries per tenth of the flood'))
+        for row in results:
+            self.stdout.write('%-15s %-4s %8s %6s %8s %8.0f  %s' % (
+                row['target'], row['mode'], row['requests'], row['statuses'].get('429', 0), row['queries'],
+                row['requests_per_second'], ' '.join(str(count) for count in row['queries_by_tenth'])))
+
+    def flood(self, name, mode, options):
+        path, build_body = TARGETS[name]
+        # fresh addresses and values every run, buckets of an earlier run do not count
+        run = uuid.uuid4().hex[:8]
+        addresses = ['10.%s.%s.%s' % (int(run[:2], 16), index // 256 % 256, index % 256)
+                     for index in range(options['addresses'])]
+        get_backend('local').clear()
+
+        counter = QueryCounter()
+        tenths = [0] * 10
+        statuses = {}
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            for index in range(options['requests']):
+                before = counter.count
+                close_old_connections()
+                response = self.client.post(path, build_body(run, index), content_type='application/json',
+                                            REMOTE_ADDR=addresses[index % len(addresses)])
+                close_old_connections()
+                statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+                tenths[index * 10 // options['requests']] += counter.count - before
+        elapsed = time.perf_counter() - started
+
+        return {
+            'target': name,
+            'mode': mode,
+            'backend': options['backend'],
+            'requests': options['requests'],
+            'addresses': options['addresses'],
+            'seconds': round(elapsed, 3),
+            'requests_per_second': options['requests'] / elapsed,
+            'queries': counter.count,
+            'queries_by_tenth': tenths,
+            'statuses': dict(sorted(statuses.items())),
+        }
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from course.models import KeyActiveModel, VideosModel
+from users.models import PhotoModel
+from utils.ids import uuid7
+
+MODELS = {'photo': PhotoModel, 'video': VideosModel}
+
+UPDATE_SQL = """
+UPDATE {table} t SET uid = data.uid
+FROM unnest(%s::integer[], %s::uuid[]) AS data(id, uid)
+WHERE t.id = data.id
+"""
+
+INDEX_SIZE_SQL = """
+SELECT i.indexrelid::regclass::text, pg_relation_size(i.indexrelid)
+FROM pg_index i WHERE i.indrelid = %s::regclass
+"""
+
+
+class Command(BaseCommand):
+    help = ('Replace the random uid of existing photos and videos with time-ordered UUIDs, in id order, '
+            'and optionally rebuild the indexes the random values bloated. Activation keys are held by '
+            'customers and are never rewritten, only their index is rebuilt.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tables', default='photo,video', help='Comma separated: photo, video.')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows updated per transaction.')
+        parser.add_argument('--reindex', action='store_true',
+                            help='REINDEX the rewritten tables and tbl_key_active afterwards.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows to rewrite.')
+
+    def handle(self, *args, **options):
+        names = [name for name in options['tables'].split(',') if name]
+        unknown = set(names) - set(MODELS)
+        if unknown:
+            raise CommandError('Unknown table(s) %s' % ', '.join(sorted(unknown)))
+
+        for name in names:
+            model = MODELS[name]
+            # uids that are already version 7 are left alone, the command can be resumed
+            pending = model.objects.extra(where=["substr(uid::text, 15, 1) <> '7'"])
+            if options['dry_run']:
+                self.stdout.write('%s: %s row(s) to rewrite' % (model._meta.db_table, pending.count()))
+                continue
+            self.rewrite(model, pending, options['batch_size'])
+
+        if options['reindex'] and not options['dry_run']:
+            for model in [MODELS[name] for name in names] + [KeyActiveModel]:
+                self.reindex(model._meta.db_table)
+
+    def rewrite(self, model, pending, batch_size):
+        table = model._meta.db_table
+        sql = UPDATE_SQL.format(table=connection.ops.quote_name(table))
+        last_id = 0
+        updated = 0
+        while True:
+            ids = list(pending.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [ids, [str(uuid7()) for _ in ids]])
+                updated += cursor.rowcount
+            last_id = ids[-1]
+            self.stdout.write('%s: %s row(s) rewritten' % (table, updated))
+        self.stdout.write(self.style.SUCCESS('%s: done, %s row(s)' % (table, updated)))
+
+    def reindex(self, table):
+        with connection.cursor() as cursor:
+            before = self.index_sizes(cursor, table)
+            cursor.execute('REINDEX TABLE %s' % connection.ops.quote_name(table))
+            after = self.index_sizes(cursor, table)
+        for index, size in sorted(before.items()):
+            self.stdout.write('%s: %.1f MB -> %.1f MB' % (index, size / 2 ** 20, after.get(index, 0) / 2 ** 20))
+
+    def index_sizes(self, cursor, table):
+        cursor.execute(INDEX_SIZE_SQL, [table])
+        return dict(cursor.fetchall())
@@ -0,0 +1,247 @@
+import datetime
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from course.models import COURSE_TITLE_FILTER, CourseModel, KeyActiveModel
+from users.models import USER_EMAIL_FILTER, PhotoModel, User
+from utils import constant
+from utils.cache import CATALOG_CACHE, bump_version
+from utils.db.copy import copy_rows, reset_sequence
+from utils.ids import build_uuid7
+
+BENCH_PASSWORD = 'bench-password'
+BENCH_EMAIL_DOMAIN = 'bench.feduu.local'
+
+WORDS = ('lập trình', 'python', 'django', 'react', 'cơ bản', 'nâng cao', 'thực chiến', 'web', 'api', 'dữ liệu',
+         'javascript', 'node', 'docker', 'thiết kế', 'giao diện', 'flutter', 'java', 'spring', 'sql', 'git')
+
+
+def zipf_weights(size, exponent=1.1):
+    """
+    Cumulative weights where a few values take most of the draws, like tags
+    and authors do in practice. Cumulative so random.choices() does not sum
+    them again on every call.
+    """
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, size + 1)))
+
+
+def model_columns(model, values):
+    """Columns of the model in field order, checked against the generated values."""
+    columns = [field.column for field in model._meta.concrete_fields if field.column in values]
+    missing = set(values) - set(columns)
+    if missing:
+        raise CommandError('%s has no column(s) %s' % (model._meta.db_table, ', '.join(sorted(missing))))
+    return columns
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a synthetic catalog for benchmarks: users, photos, courses with a '
+            'skewed type distribution and key-active rows, written with COPY.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=200000)
+        parser.add_argument('--keys-per-course', type=int, default=3)
+        parser.add_argument('--lecturer-ratio', type=float, default=0.05,
+                            help='Share of the users who are lecturers and own courses.')
+        parser.add_argument('--photo-ratio', type=float, default=0.8,
+                            help='Share of the users and courses with a photo.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, same seed same data.')
+        parser.add_argument('--method', choices=('copy', 'bulk'), default='copy',
+                            help='COPY FROM STDIN, or bulk_create for databases without COPY.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create batch.')
+
+    def handle(self, *args, **options):
+        if options['courses'] < 0 or options['users'] < 1:
+            raise CommandError('--users must be at least 1 and --courses positive')
+        self.rng = random.Random(options['seed'])
+        self.photo_salt = self.rng.getrandbits(42)
+        self.options = options
+        self.now = timezone.now()
+        self.password = make_password(BENCH_PASSWORD)
+        self.timings = {}
+
+        user_start = self.next_id(User)
+        photo_start = self.next_id(PhotoModel)
+        course_start = self.next_id(CourseModel)
+
+        users = options['users']
+        courses = options['courses']
+        lecturers = max(1, int(users * options['lecturer_ratio']))
+        user_photos = int(users * options['photo_ratio'])
+        course_photos = int(courses * options['photo_ratio'])
+
+        self.write(PhotoModel, self.photo_rows(photo_start, user_photos + course_photos))
+        self.write(User, self.user_rows(user_start, users, lecturers, photo_start, user_photos,
+                                        course_start, courses))
+        self.write(CourseModel, self.course_rows(course_start, courses, user_start, lecturers,
+                                                 photo_start + user_photos, course_photos))
+        self.write(KeyActiveModel, self.key_rows(course_start, courses, options['keys_per_course']))
+
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            for model in (PhotoModel, User, CourseModel, KeyActiveModel):
+                cursor.execute('ANALYZE %s' % connection.ops.quote_name(model._meta.db_table))
+        self.timings['analyze'] = time.perf_counter() - started
+        bump_version(CATALOG_CACHE)
+        # rows written by COPY or bulk_create never went through post_save
+        USER_EMAIL_FILTER.reset()
+        COURSE_TITLE_FILTER.reset()
+
+        for name, seconds in self.timings.items():
+            self.stdout.write('%-16s %8.1fs' % (name, seconds))
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded %s users (%s lecturers, first id %s, password %r), %s courses (first id %s), %s keys'
+            % (users, lecturers, user_start, BENCH_PASSWORD, courses, course_start,
+               courses * options['keys_per_course'])))
+
+    def next_id(self, model):
+        last = model.objects.order_by('-id').values_list('id', flat=True).first()
+        return (last or 0) + 1
+
+    def write(self, model, rows):
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return
+        table = model._meta.db_table
+        started = time.perf_counter()
+        with transaction.atomic():
+            if self.options['method'] == 'copy':
+                columns = model_columns(model, first)
+                copy_rows(table, columns, ([row[column] for column in columns]
+                                           for row in self.chain(first, rows)))
+            else:
+                self.bulk_create(model, self.chain(first, rows))
+            if model._meta.pk.column == 'id':
+                reset_sequence(table)
+        self.timings[table] = time.perf_counter() - started
+
+    def chain(self, first, rows):
+        yield first
+        yield from rows
+
+    def bulk_create(self, model, rows):
+        attnames = {field.column: field.attname for field in model._meta.concrete_fields}
+        batch = []
+        for row in rows:
+            batch.append(model(**{attnames[column]: value for column, value in row.items()}))
+            if len(batch) >= self.options['batch_size']:
+                model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+
+    def uuid(self):
+        # time-ordered like the model defaults, stamped with the seeding time
+        return build_uuid7(int(self.now.timestamp() * 1000), self.rng.getrandbits(74))
+
+    def photo_uid(self, photo_id):
+        # derived from the id, the courses carry a copy of the uid of their photo
+        return build_uuid7(int(self.now.timestamp() * 1000), self.photo_salt << 32 | photo_id)
+
+    def date(self, max_days=900):
+        return self.now - datetime.timedelta(seconds=self.rng.randrange(max_days * 86400))
+
+    def photo_rows(self, start, count):
+        for photo_id in range(start, start + count):
+            yield {'id': photo_id, 'photo': 'photo/local/bench-%s.jpg' % photo_id, 'uid': self.photo_uid(photo_id)}
+
+    def user_rows(self, start, count, lecturers, photo_start, photos, course_start, courses):
+        rng = self.rng
+        course_ids = range(course_start, course_start + courses)
+        # popular courses are owned by many students
+        popularity = zipf_weights(min(courses, 1000)) if courses else None
+        for index in range(count):
+            user_id = start + index
+            if index == 0:
+                position = constant.USER_ADMIN
+            elif index <= lecturers:
+                position = constant.USER_LECTURERS
+            else:
+                position = constant.USER_STUDENT
+            owned = []
+            if courses and position == constant.USER_STUDENT:
+                picks = min(int(rng.expovariate(0.5)), 20)
+                ranks = rng.choices(range(len(popularity)), cum_weights=popularity, k=picks)
+                owned = sorted({course_ids[rank * len(course_ids) // len(popularity)] for rank in ranks})
+            joined = self.date()
+            yield {
+                'id': user_id,
+                'password': self.password,
+                'last_login': None,
+                'is_superuser': False,
+                'username': 'bench%s' % user_id,
+                'first_name': '',
+                'last_name': '',
+                'email': 'user%s@%s' % (user_id, BENCH_EMAIL_DOMAIN),
+                'is_staff': position == constant.USER_ADMIN,
+                'is_active': True,
+                'date_joined': joined,
+                'photo_id': photo_start + index if index < photos else None,
+                'name': 'Bench User %s' % user_id,
+                'description': '',
+                'phone': '09%08d' % rng.randrange(10 ** 8),
+                'slogan': '',
+                'position': position,
+                'owner_course': owned,
+                'account_type': constant.ACCOUNT_TYPE_NORMAL,
+                'user_temporary': position == constant.USER_LECTURERS and rng.random() < 0.1,
+            }
+
+    def course_rows(self, start, count, user_start, lecturers, photo_start, photos):
+        rng = self.rng
+        types = [code for code, _ in constant.COURSE_TYPE_OPTION]
+        rng.shuffle(types)
+        type_weights = zipf_weights(len(types))
+        author_weights = zipf_weights(lecturers, 0.8)
+        # first lecturer id is user_start + 1, the first user is the admin
+        authors = range(user_start + 1, user_start + 1 + lecturers)
+        statuses = (constant.STATUS_COURSE_IS_ACTIVE,) * 7 + (
+            constant.STATUS_COURSE_IS_NEW, constant.STATUS_COURSE_IS_WAITING, constant.STATUS_COURSE_IS_FAILED)
+        for index in range(count):
+            course_id = start + index
+            author = rng.choices(authors, cum_weights=author_weights)[0]
+            course_types = sorted(set(rng.choices(types, cum_weights=type_weights, k=rng.choice((1, 1, 2, 2, 3, 4)))))
+            old_price = rng.randrange(0, 3000000, 10000)
+            photo_id = photo_start + index if index < photos else None
+            updated = self.date()
+            yield {
+                'id': course_id,
+                'created_at': updated,
+                'updated_at': updated,
+                'deleted': rng.random() < 0.02,
+                'photo_id': photo_id,
+                'title': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))).capitalize()[:255],
+                'old_price': old_price,
+                'user_id': author,
+                'new_price': int(old_price * rng.choice((1, 1, 0.9, 0.7, 0.5, 0))) // 1000 * 1000,
+                'background': '',
+                'registration_number': int(rng.paretovariate(1.2)) - 1,
+                'type': course_types,
+                'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 60)))[:500],
+                'status': rng.choice(statuses),
+                'reason': '',
+                'list_video': '',
+                'course_temporary': rng.random() < 0.05,
+                'author_username': 'bench%s' % author,
+                'photo_path': 'photo/local/bench-%s.jpg' % photo_id if photo_id else None,
+                'photo_uid': self.photo_uid(photo_id) if photo_id else None,
+            }
+
+    def key_rows(self, course_start, courses, per_course):
+        for course_id in range(course_start, course_start + courses):
+            for _ in range(per_course):
+                yield {
+                    'key_active': self.uuid(),
+                    'course_id': course_id,
+                    'created_at': self.now,
+                    'updated_at': self.now,
+                    'deleted': False,
+                }
@@ -0,0 +1,107 @@
+import collections
+import json
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import Client
+
+from course.keys import generate_keys, issue_keys
+from course.models import CourseModel, KeyActiveModel
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+class Command(BaseCommand):
+    help = ('Race parallel redemptions of the same activation keys through course/activate and '
+            'check every key is redeemed exactly once.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course-id', type=int, help='Course to issue the keys for, the first one by default.')
+        parser.add_argument('--keys', type=int, default=200, help='Keys issued for the run.')
+        parser.add_argument('--contenders', type=int, default=4,
+                            help='Threads racing for every key.')
+        parser.add_argument('--threads', type=int, default=64, help='Client threads.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        if options['keys'] < 1 or options['contenders'] < 1 or options['threads'] < 1:
+            raise CommandError('--keys, --contenders and --threads must be at least 1')
+        course = CourseModel.objects.order_by('id').first() if options['course_id'] is None else \
+            CourseModel.objects.filter(id=options['course_id']).first()
+        if course is None:
+            raise CommandError('No course to issue keys for')
+
+        seed = issue_keys(course.id, options['keys'])
+        keys = [str(key) for key in generate_keys(seed, options['keys'])]
+        # every key is attempted by several threads, spread so they collide
+        attempts = [key for key in keys for _ in range(options['contenders'])]
+        queues = [attempts[index::options['threads']] for index in range(options['threads'])]
+
+        successes = collections.Counter()
+        statuses = collections.Counter()
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def client_thread(queue):
+            client = Client(raise_request_exception=False)
+            try:
+                barrier.wait()
+                for key in queue:
+                    close_old_connections()
+                    started = time.perf_counter()
+                    response = client.post('/course/activate', {'key_active': key}, content_type='application/json')
+                    elapsed = time.perf_counter() - started
+                    close_old_connections()
+                    with lock:
+                        latencies.append(elapsed)
+                        statuses[response.status_code] += 1
+                        if response.status_code == 200:
+                            successes[key] += 1
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=client_thread, args=(queue,)) for queue in queues]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        if errors:
+            raise errors[0]
+
+        duplicated = [key for key, count in successes.items() if count > 1]
+        missed = [key for key in keys if key not in successes]
+        left = KeyActiveModel.objects.filter(key_active__in=keys).count()
+        result = {
+            'course_id': course.id,
+            'keys': len(keys),
+            'requests': len(latencies),
+            'seconds': elapsed,
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'redeemed': sum(successes.values()),
+            'duplicated': len(duplicated),
+            'missed': len(missed),
+            'left_in_db': left,
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+        else:
+            for name, value in result.items():
+                self.stdout.write('%-12s %s' % (name, value))
+        if duplicated or missed or left:
+            raise CommandError('Not exactly once: %s redeemed more than once, %s never, %s left unused'
+                               % (len(duplicated), len(missed), left))
+        self.stdout.write(self.style.SUCCESS('Every key redeemed exactly once'))
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from utils.cache import CATALOG_CACHE, bump_version
+
+# (column, source table, foreign key, source column)
+DENORMALIZED_FIELDS = (
+    ('author_username', 'tbl_user', 'user_id', 'username'),
+    ('photo_path', 'tbl_photo', 'photo_id', 'photo'),
+    ('photo_uid', 'tbl_photo', 'photo_id', 'uid'),
+)
+
+DRIFT_SQL = """
+SELECT c.id FROM tbl_course c
+LEFT JOIN {source} s ON s.id = c.{fk}
+WHERE c.{column} IS DISTINCT FROM s.{source_column}
+"""
+
+REPAIR_SQL = """
+UPDATE tbl_course c SET {column} = s.{source_column}, updated_at = now()
+FROM tbl_course c2 LEFT JOIN {source} s ON s.id = c2.{fk}
+WHERE c2.id = c.id AND c.id BETWEEN %s AND %s
+AND c.{column} IS DISTINCT FROM s.{source_column}
+"""
+
+
+class Command(BaseCommand):
+    help = 'Backfill tbl_course.author_username / photo_path / photo_uid and report drift from tbl_user / tbl_photo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drifted rows, exit with an error if there are any.')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Number of course ids updated per statement.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            return self.check_drift()
+        self.repair(options['batch_size'])
+
+    def check_drift(self):
+        drifted = 0
+        with connection.cursor() as cursor:
+            for column, source, fk, source_column in DENORMALIZED_FIELDS:
+                cursor.execute(DRIFT_SQL.format(
+                    column=column, source=source, fk=fk, source_column=source_column))
+                ids = [row[0] for row in cursor.fetchall()]
+                drifted += len(ids)
+                self.stdout.write('%s: %s drifted row(s)%s' % (
+                    column, len(ids), ' e.g. ids %s' % ids[:10] if ids else ''))
+        if drifted:
+            raise CommandError('%s drifted value(s), run sync_course_denormalized to repair' % drifted)
+        self.stdout.write(self.style.SUCCESS('No drift'))
+
+    def repair(self, batch_size):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT min(id), max(id) FROM tbl_course')
+            min_id, max_id = cursor.fetchone()
+        if min_id is None:
+            self.stdout.write('No course')
+            return
+
+        updated = 0
+        for start in range(min_id, max_id + 1, batch_size):
+            end = start + batch_size - 1
+            with transaction.atomic(), connection.cursor() as cursor:
+                for column, source, fk, source_column in DENORMALIZED_FIELDS:
+                    cursor.execute(REPAIR_SQL.format(
+                        column=column, source=source, fk=fk, source_column=source_column), [start, end])
+                    updated += cursor.rowcount
+        bump_version(CATALOG_CACHE)
+        self.stdout.write(self.style.SUCCESS('Updated %s value(s)' % updated))
@@ -0,0 +1,21 @@
+# Generated by Django 3.1 on 2026-10-18 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0010_auto_20210507_0750'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coursemodel',
+            index=models.Index(fields=['new_price', 'id'], name='tbl_course_new_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coursemodel',
+            index=models.Index(fields=['updated_at', 'id'], name='tbl_course_updated_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.1 on 2026-10-18 07:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import UnaccentExtension
+from django.db import migrations
+
+CREATE_SEARCH_CONFIG = """
+CREATE TEXT SEARCH CONFIGURATION vn_unaccent (COPY = pg_catalog.simple);
+ALTER TEXT SEARCH CONFIGURATION vn_unaccent
+    ALTER MAPPING FOR asciiword, asciihword, hword_asciipart, word, hword, hword_part
+    WITH unaccent, simple;
+"""
+
+DROP_SEARCH_CONFIG = """
+DROP TEXT SEARCH CONFIGURATION IF EXISTS vn_unaccent;
+"""
+
+CREATE_SEARCH_TRIGGER = """
+CREATE FUNCTION tbl_course_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('vn_unaccent', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('vn_unaccent', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tbl_course_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description ON tbl_course
+    FOR EACH ROW EXECUTE PROCEDURE tbl_course_search_vector_update();
+
+UPDATE tbl_course SET search_vector =
+    setweight(to_tsvector('vn_unaccent', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('vn_unaccent', coalesce(description, '')), 'B');
+"""
+
+DROP_SEARCH_TRIGGER = """
+DROP TRIGGER IF EXISTS tbl_course_search_vector_trigger ON tbl_course;
+DROP FUNCTION IF EXISTS tbl_course_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0011_course_keyset_indexes'),
+    ]
+
+    operations = [
+        UnaccentExtension(),
+        migrations.RunSQL(CREATE_SEARCH_CONFIG, DROP_SEARCH_CONFIG),
+        migrations.AddField(
+            model_name='coursemodel',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_SEARCH_TRIGGER, DROP_SEARCH_TRIGGER),
+        migrations.AddIndex(
+            model_name='coursemodel',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='tbl_course_search_vector_idx'),
+        ),
+    ]
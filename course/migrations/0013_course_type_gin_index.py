@@ -0,0 +1,18 @@
+# Generated by Django 3.1 on 2026-10-18 07:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0012_course_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coursemodel',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['type'], name='tbl_course_type_idx'),
+        ),
+    ]
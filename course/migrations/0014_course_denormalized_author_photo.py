@@ -0,0 +1,23 @@
+# Generated by Django 3.1 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0013_course_type_gin_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursemodel',
+            name='author_username',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='coursemodel',
+            name='photo_path',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 3.1 on 2026-10-18 07:03
+
+import json
+import re
+import uuid
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen copies of course.videos as of this migration, so later changes to
+# the app code or its models cannot change what it does.
+SPLIT_PATTERN = re.compile(r'[\s,;|]+')
+
+
+def _reference(value):
+    if isinstance(value, dict):
+        for key in ('id', 'uid', 'video'):
+            if value.get(key) not in (None, ''):
+                return _reference(value[key])
+        return None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return ('id', value)
+    value = str(value).strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return ('id', int(value))
+    try:
+        return ('uid', uuid.UUID(value))
+    except ValueError:
+        return ('video', value)
+
+
+def parse_video_references(value):
+    if not value:
+        return []
+    try:
+        items = json.loads(value)
+    except ValueError:
+        items = SPLIT_PATTERN.split(value)
+    if not isinstance(items, list):
+        items = [items]
+    references = [_reference(item) for item in items]
+    return [reference for reference in references if reference is not None]
+
+
+def resolve_video_ids(references, video_model):
+    lookups = {'id': set(), 'uid': set(), 'video': set()}
+    for kind, value in references:
+        lookups[kind].add(value)
+
+    known = {}
+    for kind, values in lookups.items():
+        if values:
+            rows = video_model.objects.filter(**{kind + '__in': values}).values_list(kind, 'id')
+            known.update(((kind, str(value)), pk) for value, pk in rows)
+
+    video_ids = []
+    for kind, value in references:
+        pk = known.get((kind, str(value)))
+        if pk is not None and pk not in video_ids:
+            video_ids.append(pk)
+    return video_ids
+
+
+def copy_list_video(apps, schema_editor):
+    CourseModel = apps.get_model('course', 'CourseModel')
+    VideosModel = apps.get_model('course', 'VideosModel')
+    CourseVideoModel = apps.get_model('course', 'CourseVideoModel')
+
+    batch = []
+    courses = CourseModel.objects.exclude(list_video__isnull=True).exclude(list_video='')
+    for course_id, list_video in courses.values_list('id', 'list_video').iterator():
+        video_ids = resolve_video_ids(parse_video_references(list_video), VideosModel)
+        batch.extend(
+            CourseVideoModel(course_id=course_id, video_id=video_id, position=position)
+            for position, video_id in enumerate(video_ids)
+        )
+        if len(batch) >= 1000:
+            CourseVideoModel.objects.bulk_create(batch)
+            batch = []
+    CourseVideoModel.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0014_course_denormalized_author_photo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseVideoModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_videos', to='course.coursemodel')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='video_courses', to='course.videosmodel')),
+            ],
+            options={
+                'db_table': 'tbl_course_video',
+                'ordering': ['course_id', 'position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='coursevideomodel',
+            constraint=models.UniqueConstraint(fields=('course', 'position'), name='tbl_course_video_position_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursevideomodel',
+            constraint=models.UniqueConstraint(fields=('course', 'video'), name='tbl_course_video_video_uniq'),
+        ),
+        migrations.RunPython(copy_list_video, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1 on 2026-10-18 07:23
+
+from django.db import migrations, models
+import utils.ids
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0015_course_video_relation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='keyactivemodel',
+            name='key_active',
+            field=models.UUIDField(default=utils.ids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='videosmodel',
+            name='uid',
+            field=models.UUIDField(default=utils.ids.uuid7, editable=False, unique=True),
+        ),
+    ]
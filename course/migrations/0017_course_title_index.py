@@ -0,0 +1,17 @@
+# Generated by Django 3.1 on 2026-10-18 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0016_uuid7_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coursemodel',
+            index=models.Index(fields=['title'], name='tbl_course_title_idx'),
+        ),
+    ]
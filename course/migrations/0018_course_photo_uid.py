@@ -0,0 +1,18 @@
+# Generated by Django 3.1 on 2026-10-18 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0017_course_title_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursemodel',
+            name='photo_uid',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
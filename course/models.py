@@ -1,9 +1,19 @@
 from django.db import models
 import datetime
 from users import models as user_model
-import uuid
+import re
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db.models import F
 from utils import constant
+from utils.bloom import MembershipFilter
+from utils.cache import CATALOG_CACHE, invalidate_on_save
+from utils.ids import uuid7
+
+# Text search configuration created in course/migrations/0012: the simple
+# parser with unaccent in front, so "lập trình" matches "lap trinh".
+COURSE_SEARCH_CONFIG = 'vn_unaccent'
 
 
 class BaseModel(models.Model):
@@ -33,13 +43,38 @@ def upload_path(instance, file_name):
 class VideosModel(models.Model):
     title = models.CharField(max_length=50, blank=True, null=True)
     video = models.FileField(upload_to='upload_path', blank=True, null=True)
-    uid = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
+    uid = models.UUIDField(unique=True, default=uuid7, editable=False)
 
     class Meta:
         db_table = 'tbl_video'
         ordering = ['id']
 
 
+class CourseQuerySet(models.QuerySet):
+    def in_any_type(self, types):
+        """Courses tagged with at least one of the given types (GIN, &&)."""
+        return self.filter(type__overlap=list(types))
+
+    def in_all_types(self, types):
+        """Courses tagged with every one of the given types (GIN, @>)."""
+        return self.filter(type__contains=list(types))
+
+    def search(self, text):
+        """
+        Full text search on title (weight A) and description (weight B),
+        ranked best first. Every word is matched as a prefix so results
+        follow the user while typing.
+        """
+        words = re.findall(r'\w+', text or '')
+        if not words:
+            return self
+        query = SearchQuery(' & '.join('%s:*' % word for word in words),
+                            config=COURSE_SEARCH_CONFIG, search_type='raw')
+        return self.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', 'id')
+
+
 class CourseModel(BaseModel):
     photo = models.ForeignKey(user_model.PhotoModel, related_name='photo_course', on_delete=models.CASCADE, null=True,
                               blank=True)
@@ -56,18 +91,62 @@ class CourseModel(BaseModel):
     status = models.SmallIntegerField(choices=constant.STATUS_COURSE_OPTION,
                                       default=constant.STATUS_COURSE_IS_NEW, blank=True, null=True)
     reason = models.CharField(max_length=255, default="")
+    # legacy free text video references, superseded by course_videos
     list_video = models.CharField(
         blank=True, null=True, max_length=10000, default="")
     course_temporary = models.BooleanField(default=True)
+    # copies of user.username, photo.photo and photo.uid for listings, see
+    # refresh_denormalized_fields and the sync_course_denormalized command
+    author_username = models.CharField(max_length=20, blank=True, null=True)
+    photo_path = models.CharField(max_length=255, blank=True, null=True)
+    photo_uid = models.UUIDField(blank=True, null=True)
+    # maintained by the tbl_course_search_vector_update trigger
+    search_vector = SearchVectorField(null=True, editable=False)
+    objects = CourseQuerySet.as_manager()
 
     class Meta:
         db_table = 'tbl_course'
         ordering = ['id']
+        # keyset pagination positions on (ordering key, id)
+        indexes = [
+            models.Index(fields=['new_price', 'id'], name='tbl_course_new_price_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='tbl_course_updated_at_id_idx'),
+            GinIndex(fields=['search_vector'], name='tbl_course_search_vector_idx'),
+            GinIndex(fields=['type'], name='tbl_course_type_idx'),
+            # duplicate title checks, behind COURSE_TITLE_FILTER
+            models.Index(fields=['title'], name='tbl_course_title_idx'),
+        ]
+
+    def refresh_denormalized_fields(self):
+        self.author_username = self.user.username if self.user_id else None
+        self.photo_path = self.photo.photo.name if self.photo_id else None
+        self.photo_uid = self.photo.uid if self.photo_id else None
+
+
+# answers the duplicate title check of course create and update without a query for new titles
+COURSE_TITLE_FILTER = MembershipFilter('course-title', CourseModel, 'title')
+
+
+class CourseVideoModel(models.Model):
+    course = models.ForeignKey(
+        CourseModel, related_name='course_videos', on_delete=models.CASCADE)
+    video = models.ForeignKey(
+        VideosModel, related_name='video_courses', on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'tbl_course_video'
+        ordering = ['course_id', 'position']
+        constraints = [
+            # also serves "videos of a course in order"
+            models.UniqueConstraint(fields=['course', 'position'], name='tbl_course_video_position_uniq'),
+            models.UniqueConstraint(fields=['course', 'video'], name='tbl_course_video_video_uniq'),
+        ]
 
 
 class KeyActiveModel(BaseModel):
     key_active = models.UUIDField(
-        primary_key=True, default=uuid.uuid4, editable=False)
+        primary_key=True, default=uuid7, editable=False)
     course = models.ForeignKey(
         CourseModel, related_name='key_active_course', on_delete=models.CASCADE)
 
@@ -84,3 +163,13 @@ class FeelingStudentModel(BaseModel):
 
     class Meta:
         db_table = 'tbl_feeling_student'
+
+
+# every write to what the cached course list and detail responses show, the
+# serializers and sync_course_denormalized also invalidate their bulk updates
+for catalog_model in (CourseModel, CourseVideoModel, VideosModel, user_model.PhotoModel):
+    invalidate_on_save(CATALOG_CACHE, catalog_model)
+# authors nested in the detail; logins only touch last_login
+invalidate_on_save(CATALOG_CACHE, user_model.User, fields=(
+    'email', 'name', 'username', 'position', 'phone', 'account_type', 'photo', 'slogan', 'description',
+    'owner_course', 'user_temporary'))
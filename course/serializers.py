@@ -1,17 +1,53 @@
 from abc import ABC
 
 from rest_framework import serializers
-from .models import CourseModel, FeelingStudentModel, VideosModel, KeyActiveModel
+from .keys import COURSE_INITIAL_KEYS, issue_keys, redeem_key
+from .models import CourseModel, CourseVideoModel, FeelingStudentModel, VideosModel, KeyActiveModel, COURSE_TITLE_FILTER
+from .videos import parse_video_references, resolve_video_ids, set_course_videos
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch
 import uuid
 
 from utils import exception
-from users import models as model_user
+from utils.cache import CATALOG_CACHE, invalidate_on_commit
+from utils.eagerloading import EagerLoadingSerializerMixin
+from utils.metrics import TimedSerializerMixin
+from users.models import PhotoModel
 from users.serializers import GetAllPhotoSerializer, GetAllUserSerializer
 
 
-class GetAllCourseSerializer(serializers.ModelSerializer):
-    photo = GetAllPhotoSerializer()
+class CoursePhotoField(serializers.Field):
+    """
+    The course photo as GetAllPhotoSerializer shows it, built from the
+    photo_path / photo_uid copies on tbl_course so listings do not join
+    tbl_photo.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super(CoursePhotoField, self).__init__(**kwargs)
+
+    def to_representation(self, instance):
+        if instance.photo_id is None:
+            return None
+        url = None
+        if instance.photo_path:
+            url = PhotoModel._meta.get_field('photo').storage.url(instance.photo_path)
+            request = self.context.get('request', None)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+        return {
+            'id': instance.photo_id,
+            'photo': url,
+            'uid': str(instance.photo_uid) if instance.photo_uid is not None else None,
+        }
+
+
+class GetAllCourseSerializer(TimedSerializerMixin, EagerLoadingSerializerMixin, serializers.ModelSerializer):
+    photo = CoursePhotoField()
+    defer_fields = ('list_video', 'search_vector')
 
     class Meta:
         model = CourseModel
@@ -26,19 +62,34 @@ class GetAllCourseSerializer(serializers.ModelSerializer):
             'photo',
             'status',
             'reason',
-            'list_video',
         ]
 
     def to_representation(self, instance):
         data = super(GetAllCourseSerializer, self).to_representation(instance)
-        user = model_user.User.objects.filter(id=instance.user.id).first()
-        data['user'] = user.username
+        data['user'] = instance.author_username
         return data
 
 
-class GetDetailCourseSerializer(serializers.ModelSerializer):
+class GetCourseVideoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CourseVideoModel
+        fields = ['position']
+
+    def to_representation(self, instance):
+        video = instance.video
+        return {'id': video.id, 'video': video.video.name, 'uid': video.uid, 'title': video.title,
+                'position': instance.position}
+
+
+class GetDetailCourseSerializer(TimedSerializerMixin, EagerLoadingSerializerMixin, serializers.ModelSerializer):
     photo = GetAllPhotoSerializer()
     user = GetAllUserSerializer()
+    videos = GetCourseVideoSerializer(source='course_videos', many=True, read_only=True)
+    select_related_fields = ('photo', 'user', 'user__photo')
+    prefetch_related_fields = (
+        Prefetch('course_videos', queryset=CourseVideoModel.objects.select_related('video')),
+    )
+    defer_fields = ('search_vector',)
 
     class Meta:
         model = CourseModel
@@ -55,14 +106,36 @@ class GetDetailCourseSerializer(serializers.ModelSerializer):
             'status',
             'reason',
             'list_video',
+            'videos',
         ]
 
 
+def get_video_ids(validated_data):
+    """
+    Ordered video ids for a course write: the `videos` id list when given,
+    otherwise parsed from the legacy list_video text. None leaves the
+    course videos unchanged.
+    """
+    video_ids = validated_data.pop('videos', None)
+    if video_ids is not None:
+        video_ids = list(dict.fromkeys(video_ids))
+        existing = set(VideosModel.objects.filter(id__in=video_ids).values_list('id', flat=True))
+        missing = [video_id for video_id in video_ids if video_id not in existing]
+        if missing:
+            raise exception.DoesNotExist(detail=f"video {missing} does not exist")
+        return video_ids
+    if validated_data.get('list_video'):
+        return resolve_video_ids(parse_video_references(validated_data['list_video']), VideosModel)
+    return None
+
+
 class CreateCourseSerializer(serializers.ModelSerializer):
+    videos = serializers.ListField(child=serializers.IntegerField(), required=False, write_only=True)
+
     class Meta:
         model = CourseModel
         fields = ['id', 'photo', 'old_price', 'title',
-                  'type', 'description', 'list_video']
+                  'type', 'description', 'list_video', 'videos']
 
     def validate(self, attrs):
         required_fields = ['photo', 'old_price',
@@ -71,31 +144,41 @@ class CreateCourseSerializer(serializers.ModelSerializer):
             if self.initial_data.get(field, None) is None:
                 raise exception.RequireValue(detail=f"{field} is require!")
 
-        check_math = CourseModel.objects.filter(
-            title=self.initial_data['title'].strip())
-        if check_math.count() > 0:
+        if COURSE_TITLE_FILTER.exists(self.initial_data['title'].strip()):
             raise exception.ExistedValue
         return attrs
 
     def create(self, validated_data):
         with transaction.atomic():
             user = self.context['request'].user
-            instance = CourseModel.objects.create(**validated_data)
-            id = instance.id
-            for key_active in range(10):
-                create_active_key = KeyActiveModel.objects.create(
-                    **{'course_id': id})
-                create_active_key.save()
+            video_ids = get_video_ids(validated_data)
+            instance = CourseModel(**validated_data)
             instance.user = user
+            instance.refresh_denormalized_fields()
             instance.save()
+            issue_keys(instance.id, COURSE_INITIAL_KEYS)
+            if video_ids is not None:
+                set_course_videos(instance, video_ids)
+            invalidate_on_commit(CATALOG_CACHE)
             return instance
 
 
+class IssueKeysSerializer(serializers.Serializer):
+    count = serializers.IntegerField(min_value=1)
+
+    def validate_count(self, value):
+        if value > settings.KEY_ISSUE_MAX:
+            raise exception.MaxNumberOfItem(detail=f"at most {settings.KEY_ISSUE_MAX} keys per request")
+        return value
+
+
 class UpdateCourseSerializer(serializers.ModelSerializer):
+    videos = serializers.ListField(child=serializers.IntegerField(), required=False, write_only=True)
+
     class Meta:
         model = CourseModel
         fields = ['id', 'photo', 'old_price', 'title',
-                  'type', 'description', 'list_video']
+                  'type', 'description', 'list_video', 'videos']
 
     def validate(self, attrs):
         required_fields = ['photo', 'old_price',
@@ -103,9 +186,7 @@ class UpdateCourseSerializer(serializers.ModelSerializer):
         for field in required_fields:
             if self.initial_data.get(field, None) is None:
                 raise exception.RequireValue(detail=f"{field} is require!")
-        check_math = CourseModel.objects.filter(
-            title=self.initial_data['title'].strip())
-        if check_math.count() > 0:
+        if COURSE_TITLE_FILTER.exists(self.initial_data['title'].strip()):
             raise exception.ExistedValue
         return attrs
 
@@ -113,13 +194,18 @@ class UpdateCourseSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             # for field in validated_data:
             #     setattr(instance, field, getattr(validated_data,field))
+            video_ids = get_video_ids(validated_data)
             instance.photo = validated_data['photo']
             instance.title = validated_data['title']
             instance.old_price = validated_data['old_price']
             instance.type = validated_data['type']
             instance.list_video = validated_data['list_video']
             instance.description = validated_data['description']
+            instance.refresh_denormalized_fields()
             instance.save()
+            if video_ids is not None:
+                set_course_videos(instance, video_ids)
+            invalidate_on_commit(CATALOG_CACHE)
             return instance
 
 
@@ -137,6 +223,7 @@ class DeleteCourseSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             instance.delete()
             instance.save()
+            invalidate_on_commit(CATALOG_CACHE)
             return instance
 
 
@@ -208,27 +295,20 @@ class ActivateCourseSerializer(serializers.Serializer):
         return attrs
 
     def create(self, validated_data):
-        with transaction.atomic():
-            code_activate = self.initial_data.get('key_active', None)
-            match_course = KeyActiveModel.objects.filter(
-                key_active__exact=code_activate).first()
-            if match_course is None:
-                raise exception.DoesNotExist(
-                    detail="Mã không tồn tại hoặc đã được sử dụng")
-            course = match_course.course
-            match_course.delete()
-            id = course.id
-            create_active_key = KeyActiveModel.objects.create(
-                **{'course_id': id})
-            create_active_key.save()
-            return course
+        code_activate = self.initial_data.get('key_active', None)
+        redemption = redeem_key(code_activate)
+        if redemption is None:
+            raise exception.DoesNotExist(
+                detail="Mã không tồn tại hoặc đã được sử dụng")
+        return redemption
 
     def to_representation(self, instance):
-        return {'id': instance.id, 'title': instance.title}
+        return {'id': instance.course_id, 'title': instance.title}
 
 
-class GetAllCourseTemporarySerializer(serializers.ModelSerializer):
-    photo = GetAllPhotoSerializer()
+class GetAllCourseTemporarySerializer(TimedSerializerMixin, EagerLoadingSerializerMixin, serializers.ModelSerializer):
+    photo = CoursePhotoField()
+    defer_fields = ('list_video', 'search_vector')
 
     class Meta:
         model = CourseModel
@@ -238,8 +318,7 @@ class GetAllCourseTemporarySerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         data = super(GetAllCourseTemporarySerializer,
                      self).to_representation(instance)
-        user = model_user.User.objects.filter(id=instance.user.id).first()
-        data['user'] = user.username
+        data['user'] = instance.author_username
         return data
 
 
@@ -255,4 +334,5 @@ class ChangeCourseTemporarySerializer(serializers.ModelSerializer):
         with transaction.atomic():
             instance.course_temporary = False
             instance.save()
+            invalidate_on_commit(CATALOG_CACHE)
             return instance
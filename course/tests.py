@@ -1,3 +1,181 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.db.models import Count, Prefetch
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from users.models import PhotoModel, User
+from utils import constant
+from utils.cache import CATALOG_CACHE, cache_response
+from utils.conditional import build_etag
+from utils.db.aio import get_database
+from utils.querybudget import QueryBudgetExceeded, QueryBudgetMixin, count_async_queries
+from utils.renderers import EmberJSONRenderer
+from .models import CourseModel, CourseVideoModel, VideosModel
+from .views import GetAllCourseView
+
+
+class StreamQueryBudgetTests(TestCase):
+
+    def test_queries_run_while_streaming_count(self):
+        view = QueryBudgetMixin()
+        view.query_budget = 2
+
+        def chunks():
+            for _ in range(3):
+                CourseModel.objects.exists()
+                yield b'{}'
+
+        with override_settings(QUERY_BUDGET_RAISE=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                list(view.count_stream(chunks(), 0))
+
+    def test_temporary_courses_stream_in_constant_queries(self):
+        admin = User.objects.create_user(email='admin@example.com', username='admin', password='secret',
+                                         position=constant.USER_ADMIN)
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        def list_queries():
+            with override_settings(QUERY_BUDGET_RAISE=True), CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse('list-course-temporary'))
+                b''.join(response.streaming_content)
+            return len(queries)
+
+        CourseModel.objects.create(title='course 0', user=admin, author_username=admin.username)
+        few = list_queries()
+        for index in range(1, 11):
+            CourseModel.objects.create(title='course %s' % index, user=admin, author_username=admin.username)
+        self.assertEqual(list_queries(), few)
+
+
+class KeysetOrderingTests(TestCase):
+
+    def test_cursor_pages_on_updated_at_with_equal_timestamps(self):
+        courses = [CourseModel.objects.create(title='course %s' % index) for index in range(5)]
+        stamp = timezone.now().replace(microsecond=123456)
+        CourseModel.objects.filter(id__in=[course.id for course in courses[:3]]).update(updated_at=stamp)
+        CourseModel.objects.filter(id__in=[course.id for course in courses[3:]]).update(
+            updated_at=stamp + datetime.timedelta(seconds=1))
+
+        client = APIClient()
+        seen = []
+        url = reverse('list-course')
+        params = {'cursor': '', 'ordering': '-updated_at', 'limit': 2}
+        while url:
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            seen.extend(row['id'] for row in body['body'])
+            url, params = body['paging']['next'], None
+
+        ids = [course.id for course in courses]
+        # newest first, equal timestamps by id descending, every course once
+        self.assertEqual(seen, [ids[4], ids[3], ids[2], ids[1], ids[0]])
+
+
+class ProcessCacheTests(SimpleTestCase):
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_responses_are_not_cached_per_process(self):
+        calls = []
+
+        @cache_response(CATALOG_CACHE)
+        def handler(view, request):
+            calls.append(request)
+            return request
+
+        handler(None, 'first')
+        handler(None, 'second')
+        # another worker could not see the version bump of a write
+        self.assertEqual(calls, ['first', 'second'])
+
+    def test_etag_follows_the_row_count(self):
+        view = GetAllCourseView(kwargs={})
+        request = Request(RequestFactory().get('/course/list'))
+        stamp = timezone.now()
+        # a delete keeps max(updated_at) but changes the count
+        self.assertNotEqual(build_etag(view, request, {'last_modified': stamp, 'count': 3}),
+                            build_etag(view, request, {'last_modified': stamp, 'count': 2}))
+
+
+class RendererTests(SimpleTestCase):
+
+    def test_orjson_writes_datetimes_like_drf(self):
+        data = {
+            'aware': datetime.datetime(2021, 5, 5, 8, 17, 1, 123456, tzinfo=datetime.timezone.utc),
+            'offset': datetime.datetime(2021, 5, 5, 8, 17, 1, 5, tzinfo=datetime.timezone(datetime.timedelta(hours=7))),
+            'naive': datetime.datetime(2021, 5, 5, 8, 17, 1, 999999),
+            'date': datetime.date(2021, 5, 5),
+            'time': datetime.time(8, 17, 1, 123),
+        }
+        orjson_renderer, json_renderer = EmberJSONRenderer(), EmberJSONRenderer()
+        orjson_renderer.backend, json_renderer.backend = 'orjson', 'json'
+        self.assertEqual(orjson_renderer.dumps(data), json_renderer.dumps(data))
+
+
+class AsyncDatabaseTests(TransactionTestCase):
+    """utils.db.aio rebuilds model instances itself, these pin it to what the ORM returns."""
+
+    def setUp(self):
+        author = User.objects.create_user(email='author@example.com', username='author', password='secret',
+                                          photo=PhotoModel.objects.create())
+        videos = [VideosModel.objects.create(title='video %s' % index) for index in range(3)]
+        for index in range(3):
+            course = CourseModel.objects.create(title='course %s' % index, user=author if index else None,
+                                                photo=author.photo, course_temporary=False)
+            for position, video in enumerate(videos[:index]):
+                CourseVideoModel.objects.create(course=course, video=video, position=position)
+
+    def test_fetch_matches_the_orm(self):
+        queryset = CourseModel.objects.select_related('user', 'photo').annotate(
+            video_count=Count('course_videos')).order_by('id')
+
+        def rows(courses):
+            return [(course.id, course.title, course.user and course.user.username, course.photo.uid,
+                     course.video_count) for course in courses]
+
+        self.assertEqual(rows(async_to_sync(get_database().fetch)(queryset)), rows(queryset))
+
+    def test_prefetch_matches_the_orm(self):
+        queryset = CourseModel.objects.prefetch_related(
+            Prefetch('course_videos', queryset=CourseVideoModel.objects.select_related('video')))
+
+        def rows(courses):
+            return [(course.id, [(link.position, link.video.title) for link in course.course_videos.all()])
+                    for course in courses]
+
+        expected = rows(queryset)
+        courses = async_to_sync(get_database().fetch)(queryset)
+        with self.assertNumQueries(0):
+            self.assertEqual(rows(courses), expected)
+
+    def test_count_exists_and_empty(self):
+        database = get_database()
+        queryset = CourseModel.objects.filter(title__startswith='course')
+        self.assertEqual(async_to_sync(database.count)(queryset), 3)
+        self.assertTrue(async_to_sync(database.exists)(queryset))
+        empty = CourseModel.objects.filter(id__in=[])
+        self.assertEqual(async_to_sync(database.fetch)(empty), [])
+        self.assertEqual(async_to_sync(database.count)(empty), 0)
+        self.assertFalse(async_to_sync(database.exists)(empty))
+
+    def test_statements_count_against_the_budget(self):
+        async def run():
+            with count_async_queries() as counter:
+                await get_database().count(CourseModel.objects.all())
+                await get_database().exists(CourseModel.objects.all())
+            return counter.count
+
+        self.assertEqual(async_to_sync(run)(), 2)
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_async_list_stays_within_its_budget(self):
+        response = async_to_sync(AsyncClient().get)(reverse('list-course-async'))
+        self.assertEqual(response.status_code, 200)
@@ -2,7 +2,8 @@ from django.urls import path
 from django.conf.urls import url
 from django.conf import settings
 from django.conf.urls.static import static
-from .views import GetAllCourseView, CreateCourseView, DeleteCourseView, DetailCourseView, UpdateCourseView, CreateFeelingStudentModelView, GetCourseForLecturerAndAdminView, UploadVideosView, CheckDiscountView, activateCourseView, GetAllCourseTemporaryView, ChangeCourseTemporaryView
+from .async_views import AsyncGetAllCourseView, AsyncDetailCourseView
+from .views import GetAllCourseView, CreateCourseView, DeleteCourseView, DetailCourseView, UpdateCourseView, CreateFeelingStudentModelView, GetCourseForLecturerAndAdminView, UploadVideosView, CheckDiscountView, activateCourseView, GetAllCourseTemporaryView, ChangeCourseTemporaryView, CatalogCacheStatsView, IssueKeysView
 
 urlpatterns = [
     path('list-owner', GetCourseForLecturerAndAdminView.as_view(),
@@ -18,10 +19,16 @@ urlpatterns = [
     url(r'^delete/(?P<id>\d+)$', DeleteCourseView.as_view(), name='delete-course'),
     path('check-discount', CheckDiscountView.as_view(), name='check-discount'),
     path('activate', activateCourseView.as_view(), name='check-activate-course'),
+    url(r'^issue-keys/(?P<id>\d+)$', IssueKeysView.as_view(), name='issue-keys'),
     path('list-temporary', GetAllCourseTemporaryView.as_view(),
          name='list-course-temporary'),
     # path('change-course-temporary', ChangeCourseTemporaryView.as_view(), name='list-course-temporary'),
     url(r'^update-temporary/(?P<id>\d+)$',
         ChangeCourseTemporaryView.as_view(), name='update-temporary-course'),
+    # async versions of the catalog reads, for the ASGI application
+    path('async/list', AsyncGetAllCourseView.as_view(), name='list-course-async'),
+    url(r'^async/list/(?P<id>\d+)$',
+        AsyncDetailCourseView.as_view(), name='detail-course-async'),
+    path('cache-stats', CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
 ]
 #  + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,76 @@
+import json
+import re
+import uuid
+
+from .models import CourseVideoModel
+
+SPLIT_PATTERN = re.compile(r'[\s,;|]+')
+
+
+def _reference(value):
+    if isinstance(value, dict):
+        for key in ('id', 'uid', 'video'):
+            if value.get(key) not in (None, ''):
+                return _reference(value[key])
+        return None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return ('id', value)
+    value = str(value).strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return ('id', int(value))
+    try:
+        return ('uid', uuid.UUID(value))
+    except ValueError:
+        return ('video', value)
+
+
+def parse_video_references(value):
+    """
+    Read the legacy CourseModel.list_video text into an ordered list of
+    ('id' | 'uid' | 'video', value) references. Accepts the JSON list the
+    upload endpoint returns (objects, ids or uids) as well as plain
+    comma / whitespace separated ids, uids or file names.
+    """
+    if not value:
+        return []
+    try:
+        items = json.loads(value)
+    except ValueError:
+        items = SPLIT_PATTERN.split(value)
+    if not isinstance(items, list):
+        items = [items]
+    references = [_reference(item) for item in items]
+    return [reference for reference in references if reference is not None]
+
+
+def resolve_video_ids(references, video_model):
+    """Map references to VideosModel ids, keeping order and dropping unknown ones."""
+    lookups = {'id': set(), 'uid': set(), 'video': set()}
+    for kind, value in references:
+        lookups[kind].add(value)
+
+    known = {}
+    for kind, values in lookups.items():
+        if values:
+            rows = video_model.objects.filter(**{kind + '__in': values}).values_list(kind, 'id')
+            known.update(((kind, str(value)), pk) for value, pk in rows)
+
+    video_ids = []
+    for kind, value in references:
+        pk = known.get((kind, str(value)))
+        if pk is not None and pk not in video_ids:
+            video_ids.append(pk)
+    return video_ids
+
+
+def set_course_videos(course, video_ids, course_video_model=CourseVideoModel):
+    """Replace the ordered videos of a course in two statements."""
+    course_video_model.objects.filter(course_id=course.id).delete()
+    course_video_model.objects.bulk_create([
+        course_video_model(course_id=course.id, video_id=video_id, position=position)
+        for position, video_id in enumerate(video_ids)
+    ])
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
     'users',
     'rest_framework',
@@ -57,7 +58,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'utils.custommiddleware.QueryCountDebugMiddleware',
+    'utils.custommiddleware.MetricsMiddleware',
+    'utils.custommiddleware.ReplicaRoutingMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -108,21 +110,175 @@ DATABASES = {
     }
 }
 
+# Connection handling per worker process:
+#   off         one connection per request (Django default)
+#   persistent  one connection per thread, kept for CONN_MAX_AGE seconds
+#   pool        utils.db.pool, shared by the threads of the process
+DATABASE_POOL_MODE = os.getenv('DATABASE_POOL_MODE', 'off')
+if DATABASE_POOL_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('CONN_MAX_AGE', 60))
+elif DATABASE_POOL_MODE == 'pool':
+    DATABASES['default']['ENGINE'] = 'utils.db.backends.postgresql_pool'
+    DATABASES['default']['POOL'] = {
+        'MAX_SIZE': int(os.getenv('DATABASE_POOL_MAX_SIZE', 10)),
+        'IDLE_TIMEOUT': int(os.getenv('DATABASE_POOL_IDLE_TIMEOUT', 300)),
+        'MAX_LIFETIME': int(os.getenv('DATABASE_POOL_MAX_LIFETIME', 3600)),
+        'PRE_PING': os.getenv('DATABASE_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+        'TIMEOUT': int(os.getenv('DATABASE_POOL_TIMEOUT', 10)),
+    }
+
+# Read replicas, comma separated host[:port][/name] entries, each becomes a
+# replica_<n> alias. Pointing one at DATABASE_HOST exercises the routing
+# locally against a single database.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv('DATABASE_REPLICA_HOSTS', '').split(',')), 1):
+    replica_host, _, replica_name = replica.strip().partition('/')
+    replica_host, _, replica_port = replica_host.partition(':')
+    alias = 'replica_%s' % index
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=replica_host,
+        PORT=replica_port or DATABASES['default']['PORT'],
+        NAME=replica_name or DATABASES['default']['NAME'],
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+# connections per event loop used by the async views (utils.db.aio)
+ASYNC_DATABASE_POOL_SIZE = int(os.getenv('ASYNC_DATABASE_POOL_SIZE', 20))
+
+DATABASE_ROUTERS = ['utils.dbrouter.ReplicaRouter']
+# seconds a client keeps reading the primary after a write
+DATABASE_REPLICA_LAG_WINDOW = int(os.getenv('DATABASE_REPLICA_LAG_WINDOW', 5))
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a cached course list/detail response lives; writes invalidate earlier.
+# Responses are only cached with REDIS_URL, LocMemCache is per process
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+# Activation keys issued per course/issue-keys request, and the size up to
+# which they are inserted with bulk_create rather than COPY
+KEY_ISSUE_MAX = int(os.getenv('KEY_ISSUE_MAX', 1000000))
+KEY_ISSUE_BULK_CREATE_MAX = int(os.getenv('KEY_ISSUE_BULK_CREATE_MAX', 1000))
+# A course gets KEY_POOL_REFILL new keys when a redemption leaves it with
+# fewer than KEY_POOL_LOW_WATERMARK
+KEY_POOL_LOW_WATERMARK = int(os.getenv('KEY_POOL_LOW_WATERMARK', 5))
+KEY_POOL_REFILL = int(os.getenv('KEY_POOL_REFILL', 10))
+
+# Authenticate from the signed claims of the access token (id, username,
+# position, version) instead of loading the user on every request
+JWT_STATELESS_AUTH = os.getenv('JWT_STATELESS_AUTH', 'false').lower() in ('1', 'true', 'yes')
+# Seconds the token version of a user is cached (with REDIS_URL only, LocMemCache is per process)
+TOKEN_VERSION_CACHE_TIMEOUT = int(os.getenv('TOKEN_VERSION_CACHE_TIMEOUT', 60))
+# Seconds the profile returned by login and refresh is cached, user saves invalidate it
+# (with REDIS_URL only, LocMemCache is per process)
+PROFILE_CACHE_TIMEOUT = int(os.getenv('PROFILE_CACHE_TIMEOUT', 3600))
+
+# threads hashing and checking passwords, per process, off the request workers
+PASSWORD_HASHER_WORKERS = int(os.getenv('PASSWORD_HASHER_WORKERS', 2))
+# password jobs allowed to wait for a hasher thread, more are refused with a 503
+PASSWORD_HASHER_QUEUE = int(os.getenv('PASSWORD_HASHER_QUEUE', 16))
+# seconds a request waits for its password job before giving up with a 503
+PASSWORD_HASHER_TIMEOUT = float(os.getenv('PASSWORD_HASHER_TIMEOUT', 5))
+# Retry-After, in seconds, of a refused password job
+PASSWORD_HASHER_RETRY_AFTER = int(os.getenv('PASSWORD_HASHER_RETRY_AFTER', 1))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'utils.authentication.StatelessJWTAuthentication' if JWT_STATELESS_AUTH
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend','rest_framework.filters.OrderingFilter'],
     'DEFAULT_RENDERER_CLASSES': (
         'utils.renderers.EmberJSONRenderer',
     ),
     'DEFAULT_PAGINATION_CLASS': 'utils.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # token buckets of utils.throttling: "<scope>" per client address,
+    # "<scope>_key" per username, email or code from one address
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '20/min',
+        'login_key': '5/min',
+        'login-no-pass': '20/min',
+        'login-no-pass_key': '5/min',
+        'check-email': '30/min',
+        'check-email_key': '10/min',
+        'check-discount': '30/min',
+        'check-discount_key': '10/min',
+        'activate': '10/min',
+        'activate_key': '3/min',
+    },
+    # proxies in front of the app: the client address is taken this many
+    # hops from the end of X-Forwarded-For, 0 uses REMOTE_ADDR and ignores
+    # the header a client can forge
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
+# Throttle the public login, check and activate endpoints
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# 'redis' shares the buckets between processes, 'local' keeps them per process
+THROTTLE_BACKEND = os.getenv('THROTTLE_BACKEND', 'redis' if REDIS_URL else 'local')
+# buckets a process keeps in memory before dropping the least recently used
+THROTTLE_LOCAL_MAX_KEYS = int(os.getenv('THROTTLE_LOCAL_MAX_KEYS', 100000))
+
+# Bloom filters in front of the email and course title existence checks:
+# 'redis' shares one bitmap between processes, 'local' keeps one per process
+# (it needs the shared Redis cache all the same) and 'off' asks the database
+BLOOM_BACKEND = os.getenv('BLOOM_BACKEND', 'redis' if REDIS_URL else 'off')
+# false positive rate at capacity, capacity being the rows at build time times
+# BLOOM_GROWTH and at least BLOOM_MIN_CAPACITY
+BLOOM_ERROR_RATE = float(os.getenv('BLOOM_ERROR_RATE', 0.01))
+BLOOM_GROWTH = float(os.getenv('BLOOM_GROWTH', 2))
+BLOOM_MIN_CAPACITY = int(os.getenv('BLOOM_MIN_CAPACITY', 10000))
+# seconds between two builds of a stale filter by a process
+BLOOM_REBUILD_INTERVAL = int(os.getenv('BLOOM_REBUILD_INTERVAL', 60))
+# seconds a build may hold the Redis build lock
+BLOOM_BUILD_TIMEOUT = int(os.getenv('BLOOM_BUILD_TIMEOUT', 600))
+# rows fetched per round trip while building
+BLOOM_BUILD_CHUNK = int(os.getenv('BLOOM_BUILD_CHUNK', 10000))
+
+# 'orjson' (falls back to 'json' when orjson is not installed) or 'json'
+JSON_RENDERER_BACKEND = os.getenv('JSON_RENDERER_BACKEND', 'orjson')
+
+# Page totals: seconds a CachedCount lives, estimated rows above which
+# EstimatedCount stops running COUNT(*)
+COUNT_CACHE_TIMEOUT = int(os.getenv('COUNT_CACHE_TIMEOUT', 60))
+COUNT_ESTIMATE_THRESHOLD = int(os.getenv('COUNT_ESTIMATE_THRESHOLD', 10000))
+
+# bearer token required by /metrics when set
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Statements slower than this are kept, with their EXPLAIN plan, for
+# /slow-queries, 200 by default ('off' disables the recorder)
+SLOW_QUERY_THRESHOLD_MS = (None if os.getenv('SLOW_QUERY_THRESHOLD_MS', '200') == 'off'
+                           else int(os.getenv('SLOW_QUERY_THRESHOLD_MS', '200')))
+SLOW_QUERY_MAX_FINGERPRINTS = int(os.getenv('SLOW_QUERY_MAX_FINGERPRINTS', 200))
+SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', 600))
+
+# Views with a query_budget raise when they run more queries than declared
+QUERY_BUDGET_RAISE = DEBUG
+
 PASSWORD_HASHERS = [
     # Default list in 3.1 https://docs.djangoproject.com/en/3.1/ref/settings/#password-hashers
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
@@ -158,6 +314,7 @@ SIMPLE_JWT = {
 }
 
 # AUTHENTICATION_BACKENDS = ('users.UsernameOrEmailBackend')
+AUTHENTICATION_BACKENDS = ['users.backends.PooledModelBackend']
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -3,10 +3,16 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from utils.metrics import metrics_view
+from utils.views import MembershipFilterStatsView, SlowQueryListView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('course/', include('course.urls')),
     path('user/', include('users.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('slow-queries', SlowQueryListView.as_view(), name='slow-queries'),
+    path('membership-filters', MembershipFilterStatsView.as_view(), name='membership-filters'),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
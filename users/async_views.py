@@ -0,0 +1,15 @@
+from rest_framework import status
+from rest_framework.response import Response
+
+from utils.asyncviews import AsyncAPIViewMixin
+from .models import USER_EMAIL_FILTER
+from .views import CheckEmailUserView
+
+
+class AsyncCheckEmailUserView(AsyncAPIViewMixin, CheckEmailUserView):
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = await USER_EMAIL_FILTER.aexists(serializer.validated_data['email'])
+        return Response(data=serializer.to_representation({'result': result}), status=status.HTTP_200_OK)
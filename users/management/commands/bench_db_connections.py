@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+from utils.db.pool import get_pool_stats
+
+MODES = ('off', 'persistent', 'pool')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+class Command(BaseCommand):
+    help = ('Compare connection-per-request, persistent and pooled database connections '
+            'on user/check-email-exist. Each mode runs in its own process.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default=','.join(MODES), help='Comma separated DATABASE_POOL_MODE values.')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per thread.')
+        parser.add_argument('--threads', type=int, default=4, help='Concurrent client threads.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+        parser.add_argument('--worker', action='store_true', help='Internal: measure the current mode.')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self.run_worker(options['requests'], options['threads'])))
+            return
+
+        results = []
+        for mode in options['modes'].split(','):
+            if mode not in MODES:
+                raise CommandError('Unknown mode %r, use %s' % (mode, ', '.join(MODES)))
+            completed = subprocess.run(
+                [sys.executable, sys.argv[0], 'bench_db_connections', '--worker',
+                 '--requests', str(options['requests']), '--threads', str(options['threads'])],
+                env=dict(os.environ, DATABASE_POOL_MODE=mode),
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+            )
+            if completed.returncode:
+                raise CommandError('%s mode failed:\n%s' % (mode, completed.stderr))
+            # the worker prints its result last, after any request logging
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            result['mode'] = mode
+            results.append(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write('%-11s %9s %9s %9s %12s' % ('mode', 'req/s', 'p50 ms', 'p95 ms', 'connections'))
+        for row in results:
+            self.stdout.write('%-11s %9.0f %9.2f %9.2f %12s' % (
+                row['mode'], row['throughput'], row['p50_ms'], row['p95_ms'], row['connections']))
+
+    def run_worker(self, requests, threads):
+        opened = []
+        connection_created.connect(lambda sender, connection, **kwargs: opened.append(1), weak=False)
+        latencies = []
+        errors = []
+
+        def client_thread(index):
+            client = Client()
+            payload = {'email': 'bench-%s@example.com' % index}
+            try:
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    # the test client skips the request_started / request_finished
+                    # connection handling of the real handlers, do it here
+                    close_old_connections()
+                    response = client.post('/user/check-email-exist', payload)
+                    close_old_connections()
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise CommandError('check-email-exist answered %s' % response.status_code)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=client_thread, args=(index,)) for index in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        if errors:
+            raise errors[0]
+
+        pool = get_pool_stats().get('default')
+        return {
+            'requests': len(latencies),
+            'seconds': elapsed,
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            # reused pool connections also fire connection_created
+            'connections': pool.get('created', 0) if pool else len(opened),
+            'pool': pool,
+        }
@@ -0,0 +1,20 @@
+# Generated by Django 3.1 on 2026-10-18 07:23
+
+from django.db import migrations, models
+import utils.ids
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_temporary_user'),
+        ('users', '0006_auto_20210507_0745'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='photomodel',
+            name='uid',
+            field=models.UUIDField(default=utils.ids.uuid7, editable=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1 on 2026-10-18 07:47
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_user_token_version'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='temporary_user',
+        ),
+    ]
@@ -1,14 +1,16 @@
 from __future__ import unicode_literals
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
 from django.contrib.auth.models import PermissionsMixin
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
 import os.path
-import uuid
 
 from utils import constant
+from utils.bloom import MembershipFilter
+from utils.ids import uuid7
 
 
 class MyUserManager(BaseUserManager):
@@ -60,7 +62,7 @@ def upload_path(instance, file_name):
 
 class PhotoModel(models.Model):
     photo = models.ImageField(blank=True, null=True, upload_to=upload_path)
-    uid = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
+    uid = models.UUIDField(unique=True, default=uuid7, editable=False)
 
     class Meta:
         db_table = 'tbl_photo'
@@ -85,8 +87,13 @@ class User(AbstractUser):
     account_type = models.SmallIntegerField(choices=constant.ACCOUNT_TYPE,
                                             default=constant.ACCOUNT_TYPE_NORMAL, null=True, blank=True)
     user_temporary = models.BooleanField(default=True)
+    # claim of the access tokens, a change of TOKEN_FIELDS bumps it and
+    # revokes the tokens issued before, see utils.authentication
+    token_version = models.PositiveIntegerField(default=0)
     objects = MyUserManager()
 
+    TOKEN_FIELDS = ('username', 'password', 'position', 'is_active')
+
     EMAIL_FIELD = 'email'
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = []
@@ -95,12 +102,41 @@ class User(AbstractUser):
         db_table = 'tbl_user'
         ordering = ['id']
 
+    def __init__(self, *args, **kwargs):
+        super(User, self).__init__(*args, **kwargs)
+        self._token_fields = self.get_token_fields()
+
+    def get_token_fields(self):
+        # read from __dict__, deferred fields are not loaded for this
+        return tuple(self.__dict__.get(name) for name in self.TOKEN_FIELDS)
+
+    def save(self, *args, **kwargs):
+        # utils.authentication and users.profile need the user model, imported here
+        from utils.authentication import token_version_key
+        from users.profile import invalidate_profile
+
+        bumped = self.pk is not None and self.get_token_fields() != self._token_fields
+        if bumped:
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'token_version'}
+        super(User, self).save(*args, **kwargs)
+        self._token_fields = self.get_token_fields()
+        invalidate_profile(self.pk)
+        if bumped:
+            key = token_version_key(self.pk)
+            transaction.on_commit(lambda: cache.delete(key), using=kwargs.get('using') or self._state.db)
+
     def __str__(self):
         return self.email
 
     def __unicode__(self):
         return self.email
 
+
+# answers check-email-exist without a query for unknown emails
+USER_EMAIL_FILTER = MembershipFilter('user-email', User, 'email')
+
 # class EmailBackend(ModelBackend):
 #     def authenticate(self, request, username=None, password=None, **kwargs):
 #         try:  # to allow authentication through phone number or any other field, modify the below statement
@@ -2,10 +2,14 @@ from abc import ABC
 
 from rest_framework import serializers
 from django.db import transaction
-from utils import exception
+from django.utils import timezone
+from utils import exception, hashing
+from utils.cache import CATALOG_CACHE, invalidate_on_commit
+from utils.eagerloading import EagerLoadingSerializerMixin
+from utils.metrics import TimedSerializerMixin
 from .models import User as UserModel
-from .models import PhotoModel
-from django.contrib.auth.hashers import make_password, identify_hasher, check_password
+from .models import PhotoModel, USER_EMAIL_FILTER
+from course.models import CourseModel
 from django.contrib.auth.models import User as User_auth
 
 
@@ -16,9 +20,9 @@ def validate_password(value: str) -> str:
     :param value: password of a user
     :return: a hashed version of the password
     """
-    return make_password(value, 'salt')
+    return hashing.make_password(value, 'salt')
 
-class GetAllPhotoSerializer(serializers.ModelSerializer):
+class GetAllPhotoSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = PhotoModel
         fields = '__all__'
@@ -26,8 +30,11 @@ class GetAllPhotoSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         return attrs
 
-class GetAllUserSerializer(serializers.ModelSerializer):
+class GetAllUserSerializer(TimedSerializerMixin, EagerLoadingSerializerMixin, serializers.ModelSerializer):
     photo = GetAllPhotoSerializer()
+    temporary_user = serializers.BooleanField(source='user_temporary', read_only=True)
+    select_related_fields = ('photo',)
+
     class Meta:
         model = UserModel
         fields = [
@@ -95,8 +102,8 @@ class ChangePasswordSerializer(serializers.Serializer):
     def validate(self, attrs):
         if self.initial_data.get('old_password', None) is None:
             raise exception.RequireValue(detail=f"old_password is require!!!")
-        is_correct_password = self.instance.check_password(
-            self.initial_data.get('old_password'))
+        is_correct_password = hashing.check_password(
+            self.instance, self.initial_data.get('old_password'))
         if is_correct_password is False:
             raise exception.APIException(detail="password is wrong!!!")
         if self.initial_data.get('old_password', None) is not None:
@@ -104,12 +111,13 @@ class ChangePasswordSerializer(serializers.Serializer):
         return attrs
 
     def update(self, instance, validated_data):
+        # hashed before the transaction opens, no connection is held while waiting for the pool
+        if validated_data.get('new_password', None) is not None:
+            password = validate_password(validated_data.get('new_password'))
+        else:
+            password = validate_password('Fedu@12345')
         with transaction.atomic():
-            if validated_data.get('new_password', None) is not None:
-                instance.password = validate_password(
-                    validated_data.get('new_password'))
-            else:
-                instance.password = validate_password('Fedu@12345')
+            instance.password = password
             instance.save()
             return {}
 
@@ -141,9 +149,15 @@ class UpdateUserSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         with transaction.atomic():
+            old_username = instance.username
             for attr_user in validated_data:
                 setattr(instance, attr_user, validated_data.get(attr_user, None))
             instance.save()
+            if instance.username != old_username:
+                # courses carry a copy of the author username
+                CourseModel.objects.filter(user_id=instance.id).update(
+                    author_username=instance.username, updated_at=timezone.now())
+            invalidate_on_commit(CATALOG_CACHE)
             return instance
 
     def to_representation(self, instance):
@@ -193,17 +207,12 @@ class CheckEmailUserSerializer(serializers.Serializer):
         return attrs
 
     def create(self, validated_data):
-        with transaction.atomic():
-            result = False
-            email_check = UserModel.objects.filter(email=validated_data['email'])
-            if email_check.count() > 0:
-                result = True
-            return { "result": result}
+        return {"result": USER_EMAIL_FILTER.exists(validated_data['email'])}
 
     def to_representation(self, instance):
         return {'is_exist': instance.get("result")}
 
-class GetAllTemporarySerializer(serializers.ModelSerializer):
+class GetAllTemporarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = UserModel
         fields = [
@@ -1,3 +1,124 @@
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from course.models import CourseModel
+from utils.authentication import Principal, add_principal_claims
+from utils.throttling import KeyThrottle, LocalBuckets, RedisBuckets, get_backend
+from .models import USER_EMAIL_FILTER, PhotoModel, User
+from .profile import get_profile
+from .serializers import UpdateUserSerializer
+
+
+class UserListTests(TestCase):
+
+    def test_users_stream_in_constant_queries(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(email='reader@example.com', username='reader',
+                                                           password='secret'))
+
+        def list_queries():
+            with override_settings(QUERY_BUDGET_RAISE=True), CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse('list-user'))
+                b''.join(response.streaming_content)
+            return len(queries)
+
+        few = list_queries()
+        for index in range(10):
+            User.objects.create_user(email='user%s@example.com' % index, username='user%s' % index,
+                                     password='secret', photo=PhotoModel.objects.create())
+        self.assertEqual(list_queries(), few)
+
+
+class PrincipalTests(SimpleTestCase):
+
+    def test_writes_are_read_back(self):
+        user = SimpleNamespace(id=1, pk=1, username='old', position=2, token_version=0, is_active=True)
+        with mock.patch('utils.authentication.load_user', return_value=user):
+            principal = Principal({'user_id': 1, 'username': 'old', 'position': 2, 'ver': 0})
+            self.assertEqual(principal.username, 'old')
+            principal.username = 'new'
+            self.assertEqual(user.username, 'new')
+            self.assertEqual(principal.username, 'new')
+
+
+class StatelessRenameTests(TestCase):
+
+    def test_rename_updates_the_course_author(self):
+        photo = PhotoModel.objects.create()
+        user = User.objects.create_user(email='old@example.com', username='old', password='secret', photo=photo)
+        course = CourseModel.objects.create(title='course', user=user, author_username='old')
+        principal = Principal(add_principal_claims(AccessToken.for_user(user), user))
+
+        serializer = UpdateUserSerializer(principal, data={
+            'username': 'new', 'phone': '0123', 'name': 'name', 'email': 'old@example.com', 'photo': photo.id})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(principal.username, 'new')
+        course.refresh_from_db()
+        self.assertEqual(course.author_username, 'new')
+
+
+class ProfileCacheTests(SimpleTestCase):
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_profiles_are_not_cached_per_process(self):
+        with mock.patch('users.profile.load_profile', side_effect=[{'username': 'old'}, {'username': 'new'}]):
+            self.assertEqual(get_profile(1), {'username': 'old'})
+            # saved on another worker, whose version bump this process cannot see
+            self.assertEqual(get_profile(1), {'username': 'new'})
+
+
+class LoginThrottleTests(SimpleTestCase):
+
+    def setUp(self):
+        get_backend('local').clear()
+
+    def attempt(self, address):
+        request = APIRequestFactory().post('/user/login', {'username': 'victim'}, format='json', REMOTE_ADDR=address)
+        view = SimpleNamespace(throttle_scope='login', throttle_key_field='username', throttle_backend='local')
+        return KeyThrottle().allow_request(Request(request, parsers=[JSONParser()]), view)
+
+    @override_settings(THROTTLE_ENABLED=True)
+    def test_username_bucket_is_per_address(self):
+        # login_key is 5/min
+        self.assertEqual([self.attempt('10.0.0.1') for _ in range(6)], [True] * 5 + [False])
+        # the victim still logs in from their own address
+        self.assertTrue(self.attempt('10.0.0.2'))
+
+    def test_redis_outage_is_logged_once(self):
+        buckets = RedisBuckets(LocalBuckets(100))
+        buckets.script = mock.Mock(side_effect=ConnectionError('down'))
+        with self.assertLogs('utils.throttling', 'WARNING') as logs:
+            for _ in range(3):
+                self.assertEqual(buckets.take('throttle:test', 10, 1)[0], True)
+        self.assertEqual(len(logs.records), 1)
+
+
+@override_settings(BLOOM_BACKEND='off')
+class MembershipFilterOffTests(SimpleTestCase):
+
+    def test_saved_is_a_no_op(self):
+        with mock.patch('utils.bloom.transaction.on_commit') as on_commit:
+            USER_EMAIL_FILTER.saved(User, User(email='off@example.com'))
+        on_commit.assert_not_called()
+
+
+@override_settings(BLOOM_BACKEND='off')
+class SaveWithFiltersOffTests(TransactionTestCase):
+
+    def test_user_and_course_save(self):
+        # autocommit, the on_commit callbacks run on save
+        user = User.objects.create_user(email='off@example.com', username='off', password='secret')
+        course = CourseModel.objects.create(title='off', user=user)
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+        self.assertTrue(CourseModel.objects.filter(pk=course.pk).exists())
@@ -1,5 +1,6 @@
 from django.urls import path, include
 from django.conf.urls import url
+from .async_views import AsyncCheckEmailUserView
 from .views import GetAllUserView, CreateUserView, ChangePasswordView
 from .views import MyTokenObtainPairView, CustomTokenRefreshView, ResetPasswordView, LoginWithNoPasswordView, UpdateUserView, DeleteUserView, UploadPhotoView, GetAllPhotoView, CheckEmailUserView, GetAllTemporaryView, ChangeUserTemporaryView
 
@@ -19,6 +20,7 @@ urlpatterns = [
     #     DetailCourseView.as_view(), name='detail-user'),
     path('update', UpdateUserView.as_view(), name='update-user'),
     path('check-email-exist', CheckEmailUserView.as_view(), name='update-user'),
+    path('async/check-email-exist', AsyncCheckEmailUserView.as_view(), name='check-email-exist-async'),
     path('photo', GetAllPhotoView.as_view(), name='get-photo'),
     url(r'^delete/(?P<pk>\d+)$', DeleteUserView.as_view(), name='delete-user'),
     path('list-temporary', GetAllTemporaryView.as_view(), name='list-temporary'),
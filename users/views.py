@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User as User_auth
+from django.utils.translation import gettext_lazy as _
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import generics, status
@@ -7,85 +8,58 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenRefreshSerializer
-from rest_framework_simplejwt.state import token_backend
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenRefreshView
 from rest_framework.permissions import IsAuthenticated
 
 from .serializers import GetAllUserSerializer, ChangePasswordSerializer, UpdateUserSerializer, UploadPhotoSerializer, \
     CreateUserSerializer, GetAllPhotoSerializer, CheckEmailUserSerializer, GetAllTemporarySerializer, ChangeUserTemporarySerializer
 from utils import exception, permissions
+from utils.authentication import VERSION_CLAIM, add_principal_claims, get_token_version
+from utils.eagerloading import EagerLoadingViewMixin
+from utils.querybudget import QueryBudgetMixin
+from utils.streaming import StreamingListMixin
+from utils.throttling import IPThrottle, KeyThrottle
 from .models import User as UserModel
 from .models import PhotoModel
+from .profile import get_profile
 from utils import exception
 
 
 class CustomTokenRefreshSerializer(TokenRefreshSerializer):
     def validate(self, attrs):
-        data = super(CustomTokenRefreshSerializer, self).validate(attrs)
-        decoded_payload = token_backend.decode(data['access'], verify=True)
-        user_uid = decoded_payload['user_id']
-
-        # add filter query
-        user = UserModel.objects.filter(id=user_uid).first()
-        data['username'] = user.username
-        data['email'] = user.email
-        data['name'] = user.name
-        data['phone'] = user.phone
-        data['position'] = user.position
-        data['slogan'] = user.slogan
-        data['owner_course'] = user.owner_course
-        data['temporary_user'] = user.temporary_user
-        data['description'] = user.description
-        if hasattr(user.photo, 'id') is True:
-            data['photo'] = {
-                'id': user.photo.id,
-                'name': "image.png",
-                'status': "done",
-                'path': user.photo.photo.name,
-            }
-        else:
-            data['photo'] = {
-                'id': "",
-                'name': "image.png",
-                'status': "done",
-                'path': "",
-            }
+        # TokenRefreshSerializer.validate, keeping the decoded refresh token
+        # for the user id instead of decoding the new access token again
+        refresh = RefreshToken(attrs['refresh'])
+        user_id = refresh[jwt_settings.USER_ID_CLAIM]
+        if VERSION_CLAIM in refresh and refresh[VERSION_CLAIM] != get_token_version(user_id):
+            raise InvalidToken(_('Token has been revoked'))
+        profile = get_profile(user_id)
+        if profile is None:
+            raise InvalidToken(_('User not found'))
+
+        data = {'access': str(refresh.access_token)}
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    pass
+            refresh.set_jti()
+            refresh.set_exp()
+            data['refresh'] = str(refresh)
+
+        data.update(profile)
         return data
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
+        # tokens signed by TokenObtainPairSerializer with the claims of get_token
         data = super().validate(attrs)
-        refresh = self.get_token(self.user)
-        data['refresh'] = str(refresh)
-        data['access'] = str(refresh.access_token)
-
-        # Add extra responses hereimages_user
-        print(self.user, self.user.photo, 'user')
-        data['id'] = self.user.id
-        data['username'] = self.user.username
-        data['email'] = self.user.email
-        data['name'] = self.user.name
-        data['phone'] = self.user.phone
-        data['position'] = self.user.position
-        data['slogan'] = self.user.slogan
-        data['owner_course'] = self.user.owner_course
-        data['temporary_user'] = self.user.temporary_user
-        data['description'] = self.user.description
-        if hasattr(self.user.photo, 'id') is True:
-            data['photo'] = {
-                'id': self.user.photo.id,
-                'name': "image.png",
-                'status': "done",
-                'path': self.user.photo.photo.name,
-            }
-        else:
-            data['photo'] = {
-                'id': "",
-                'name': "image.png",
-                'status': "done",
-                'path': "",
-            }
+        data.update(get_profile(self.user.id))
         return data
 
     @classmethod
@@ -93,12 +67,15 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         token = super(MyTokenObtainPairSerializer, cls).get_token(user)
 
         # Add custom claims
-        token['username'] = user.username
+        add_principal_claims(token, user)
         return token
 
 
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
+    throttle_classes = [IPThrottle, KeyThrottle]
+    throttle_scope = 'login'
+    throttle_key_field = 'username'
 
 
 class LoginWithNoPassworsSerializer(TokenObtainPairSerializer):
@@ -107,6 +84,7 @@ class LoginWithNoPassworsSerializer(TokenObtainPairSerializer):
         token = super().get_token(user)
 
         # Add custom claims
+        add_principal_claims(token, user)
         token['name'] = user.name
         # ...
         return token
@@ -120,38 +98,15 @@ class LoginWithNoPassworsSerializer(TokenObtainPairSerializer):
         refresh = self.get_token(user)
         data['refresh'] = str(refresh)
         data['access'] = str(refresh.access_token)
-
-        # # Add extra responses here
-        print(user, user.photo, 'user')
-        data['id'] = user.id
-        data['username'] = user.username
-        data['email'] = user.email
-        data['name'] = user.name
-        data["phone"] = user.phone
-        data['position'] = user.position
-        data['slogan'] = user.slogan
-        data['owner_course'] = user.owner_course
-        data['temporary_user'] = user.temporary_user
-        data['description'] = user.description
-        if hasattr(user.photo, 'id') is True:
-            data['photo'] = {
-                'id': user.photo.id,
-                'name': "image.png",
-                'status': "done",
-                'path': user.photo.photo.name,
-            }
-        else:
-            data['photo'] = {
-                'id': "",
-                'name': "image.png",
-                'status': "done",
-                'path': "",
-            }
+        data.update(get_profile(user.id))
         return data
 
 
 class LoginWithNoPasswordView(TokenObtainPairView):
     serializer_class = LoginWithNoPassworsSerializer
+    throttle_classes = [IPThrottle, KeyThrottle]
+    throttle_scope = 'login-no-pass'
+    throttle_key_field = 'username'
 
 
 class CustomTokenRefreshView(TokenRefreshView):
@@ -161,16 +116,17 @@ class CustomTokenRefreshView(TokenRefreshView):
     serializer_class = CustomTokenRefreshSerializer
 
 
-class GetAllUserView(generics.GenericAPIView):
+class GetAllUserView(QueryBudgetMixin, StreamingListMixin, EagerLoadingViewMixin, generics.GenericAPIView):
     queryset = UserModel.objects.all()
     serializer_class = GetAllUserSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['position']
+    # authentication, users with their photo (counted while they stream)
+    query_budget = 2
 
     def get(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        serializer = GetAllUserSerializer(queryset, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        return self.stream_list(queryset)
 
 
 class CreateUserView(generics.GenericAPIView):
@@ -286,10 +242,15 @@ class GetAllPhotoView(generics.GenericAPIView):
             return Response(data=serializer.data, status=status.HTTP_200_OK)
         raise exception.APIException
 
-class CheckEmailUserView(generics.GenericAPIView):
+class CheckEmailUserView(QueryBudgetMixin, generics.GenericAPIView):
     serializer_class = CheckEmailUserSerializer
     permission_classes = []
     authentication_classes = []
+    # the EXISTS, when USER_EMAIL_FILTER cannot rule the email out
+    query_budget = 1
+    throttle_classes = [IPThrottle, KeyThrottle]
+    throttle_scope = 'check-email'
+    throttle_key_field = 'email'
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -0,0 +1,125 @@
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.utils.translation import gettext_lazy as _
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from utils.db.aio import get_database
+from utils.querybudget import count_async_queries
+
+
+async def authenticate_jwt(authenticator, request):
+    """JWTAuthentication.authenticate with the user loaded through utils.db.aio."""
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    token = authenticator.get_validated_token(raw_token)
+    try:
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    user_model = get_user_model()
+    queryset = user_model.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id})
+    users = await get_database(queryset.db).fetch(queryset)
+    if not users:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+    if not users[0].is_active:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    return users[0], token
+
+
+class AsyncAPIViewMixin(object):
+    """
+    Serve a DRF view as a Django async view, for ASGI.
+
+    Mixed in front of the sync view it replaces, so the queryset, filters,
+    pagination, serializer and permissions are shared; only the handlers
+    are coroutines and every query goes through utils.db.aio instead of
+    the blocking ORM. Authenticators need an `aauthenticate` coroutine,
+    JWTAuthentication is handled here. The rendered response is a plain
+    HttpResponse with the same envelope as the sync view.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        sync_view = super(AsyncAPIViewMixin, cls).as_view(**initkwargs)
+
+        async def view(request, *args, **kwargs):
+            return await sync_view(request, *args, **kwargs)
+
+        update_wrapper(view, sync_view)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        if getattr(self, 'query_budget', None) is None:
+            return await self.adispatch(request, *args, **kwargs)
+        # replaces the sync QueryBudgetMixin.dispatch, counting utils.db.aio statements
+        with count_async_queries() as counter:
+            response = await self.adispatch(request, *args, **kwargs)
+        self.check_budget(counter.count)
+        return response
+
+    async def adispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), None)
+            else:
+                handler = None
+            if handler is None:
+                self.http_method_not_allowed(request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        if isinstance(self.response, Response):
+            # rendered here, Django would render it on its sync thread
+            self.response = self.to_http_response(self.response)
+        return self.response
+
+    def to_http_response(self, response):
+        rendered = HttpResponse(response.rendered_content, status=response.status_code)
+        for header, value in response.items():
+            rendered[header] = value
+        return rendered
+
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+        request.version, request.versioning_scheme = self.determine_version(request, *args, **kwargs)
+
+        await self.aperform_authentication(request)
+        self.check_permissions(request)
+        # throttle buckets may live in Redis, a blocking client
+        await sync_to_async(self.check_throttles, thread_sensitive=False)(request)
+
+    async def aperform_authentication(self, request):
+        for authenticator in request.authenticators:
+            if hasattr(authenticator, 'aauthenticate'):
+                result = await authenticator.aauthenticate(request)
+            elif isinstance(authenticator, JWTAuthentication):
+                result = await authenticate_jwt(authenticator, request)
+            else:
+                raise ImproperlyConfigured(
+                    '%s cannot authenticate in an async view' % authenticator.__class__.__name__)
+            if result is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = result
+                return
+        request._not_authenticated()
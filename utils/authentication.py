@@ -0,0 +1,152 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from utils.cache import is_shared_cache
+
+VERSION_CLAIM = 'ver'
+# cached version of a deleted or inactive user, no token matches it
+REVOKED = -1
+
+
+def token_version_key(user_id):
+    return 'auth:token-version:%s' % user_id
+
+
+def add_principal_claims(token, user):
+    """Claims StatelessJWTAuthentication builds the principal from."""
+    token['username'] = user.username
+    token['position'] = user.position
+    token[VERSION_CLAIM] = user.token_version
+    return token
+
+
+def _cached_version(user_id):
+    # a per process cache would miss the User.save of other workers and accept revoked tokens
+    if not is_shared_cache():
+        return None
+    return cache.get(token_version_key(user_id))
+
+
+def _store_version(user_id, row):
+    version = row[0] if row is not None and row[1] else REVOKED
+    if is_shared_cache():
+        cache.set(token_version_key(user_id), version, settings.TOKEN_VERSION_CACHE_TIMEOUT)
+    return version
+
+
+def get_version_queryset(user_id):
+    # from the primary, a lagging replica would cache the version before a bump
+    return get_user_model().objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id)
+
+
+def get_token_version(user_id):
+    """Current token version of a user, from the cache, REVOKED when tokens must be refused."""
+    version = _cached_version(user_id)
+    if version is None:
+        row = get_version_queryset(user_id).values_list('token_version', 'is_active').first()
+        version = _store_version(user_id, row)
+    return version
+
+
+async def aget_token_version(user_id):
+    # imported here, DRF imports the authentication classes while
+    # rest_framework.views itself is loading
+    from utils.db.aio import get_database
+
+    version = await sync_to_async(_cached_version, thread_sensitive=False)(user_id)
+    if version is None:
+        queryset = get_version_queryset(user_id).values_list('token_version', 'is_active')
+        database = get_database(queryset.db)
+        compiled = database.compile(queryset[:1])
+        row = await database.fetchone(*compiled) if compiled is not None else None
+        version = await sync_to_async(_store_version, thread_sensitive=False)(user_id, row)
+    return version
+
+
+def load_user(user_id):
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is None:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+    return user
+
+
+class Principal(SimpleLazyObject):
+    """
+    request.user of StatelessJWTAuthentication. id, username, position and
+    the token version come from the token claims; the user row is loaded
+    the first time anything else is read, isinstance() checks included,
+    so assigning the principal to a foreign key still works. Once loaded,
+    the claim copies are dropped and every read and write goes to the row,
+    so a view saving request.user sees its own changes.
+    """
+    CLAIMS = ('id', 'pk', 'username', 'position', 'token_version', 'is_active', 'is_authenticated', 'is_anonymous')
+
+    def __init__(self, token):
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+        super(Principal, self).__init__(lambda: load_user(user_id))
+        # set in __dict__, LazyObject.__setattr__ would load the user
+        self.__dict__.update(
+            id=user_id,
+            pk=user_id,
+            username=token.get('username'),
+            position=token.get('position'),
+            token_version=token[VERSION_CLAIM],
+            is_active=True,
+            is_authenticated=True,
+            is_anonymous=False,
+        )
+
+    def _setup(self):
+        super(Principal, self)._setup()
+        for name in self.CLAIMS:
+            self.__dict__.pop(name, None)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication without loading the user: the token claims become a
+    lazy Principal, checked against the token version of the user, which
+    is bumped on password, username, position or is_active changes.
+    The version lives in the cache, so a request costs a cache read and no
+    query, or one query when the cache is not shared between processes. Tokens issued before the claims existed take the usual path.
+    """
+
+    def get_user(self, validated_token):
+        if VERSION_CLAIM not in validated_token:
+            return super(StatelessJWTAuthentication, self).get_user(validated_token)
+        user_id = self.get_user_id(validated_token)
+        self.check_version(validated_token, get_token_version(user_id))
+        return Principal(validated_token)
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        raw_token = self.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if VERSION_CLAIM not in validated_token:
+            from utils.asyncviews import authenticate_jwt
+            return await authenticate_jwt(self, request)
+        user_id = self.get_user_id(validated_token)
+        self.check_version(validated_token, await aget_token_version(user_id))
+        return Principal(validated_token), validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def check_version(self, validated_token, version):
+        if version == REVOKED:
+            raise AuthenticationFailed(_('User not found or inactive'), code='user_inactive')
+        if validated_token[VERSION_CLAIM] != version:
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
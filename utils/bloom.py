@@ -0,0 +1,446 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_save
+
+from utils import metrics
+from utils.cache import bump_version, get_version, is_shared_cache
+
+logger = logging.getLogger(__name__)
+
+
+def optimal_size(capacity, error_rate):
+    """Bits and hash functions of a Bloom filter holding capacity values at error_rate."""
+    size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    hashes = max(1, int(round(size / capacity * math.log(2))))
+    return size, hashes
+
+
+def expected_error_rate(size, hashes, items):
+    """False positive rate of a filter of size bits and hashes functions holding items values."""
+    return (1 - math.exp(-hashes * items / size)) ** hashes
+
+
+def bit_offsets(value, size, hashes):
+    # double hashing, the hashes offsets come from one 128 bit digest
+    digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], 'big')
+    second = int.from_bytes(digest[8:], 'big') | 1
+    return [(first + index * second) % size for index in range(hashes)]
+
+
+class BitArray(object):
+    """Bits in a bytearray, most significant bit first like Redis SETBIT."""
+
+    def __init__(self, size):
+        self.bytes = bytearray((size + 7) // 8)
+
+    def set(self, offsets):
+        for offset in offsets:
+            self.bytes[offset >> 3] |= 0x80 >> (offset & 7)
+
+    def test(self, offsets):
+        return all(self.bytes[offset >> 3] & (0x80 >> (offset & 7)) for offset in offsets)
+
+
+class LocalState(object):
+
+    def __init__(self, size, hashes, capacity, version):
+        self.bits = BitArray(size)
+        self.size = size
+        self.hashes = hashes
+        self.capacity = capacity
+        self.items = 0
+        self.version = version
+
+
+class LocalBloom(object):
+    """
+    Filter in process memory. Every committed write bumps a cache
+    namespace version: the writing process sets the bits, every other
+    process sees a newer version and answers through the database until its
+    next rebuild. The version must live in a cache every process shares,
+    a per process cache would hide the writes of the others. Suits rarely
+    written values; RedisBloom shares the bits instead.
+    """
+    kind = 'local'
+
+    def __init__(self, membership):
+        self.membership = membership
+        self.namespace = 'bloom:%s' % membership.name
+        self.state = None
+        self.lock = threading.Lock()
+
+    def probe(self, value):
+        state = self.state
+        if state is None or state.items > state.capacity or state.version != get_version(self.namespace):
+            return None
+        return state.bits.test(bit_offsets(value, state.size, state.hashes))
+
+    def add(self, value):
+        version = bump_version(self.namespace)
+        with self.lock:
+            state = self.state
+            # bits only follow writes this process saw on top of a current filter
+            if state is not None and state.version == version - 1:
+                state.bits.set(bit_offsets(value, state.size, state.hashes))
+                state.items += 1
+                state.version = version
+
+    def build(self):
+        # read before the scan: writes committed during the scan bump past it
+        version = get_version(self.namespace)
+        size, hashes, capacity = self.membership.get_size()
+        state = LocalState(size, hashes, capacity, version)
+        for value in self.membership.scan():
+            state.bits.set(bit_offsets(value, size, hashes))
+            state.items += 1
+        self.state = state
+        return True
+
+    def reset(self):
+        bump_version(self.namespace)
+
+    def stats(self):
+        state = self.state
+        if state is None:
+            return {'ready': False}
+        return {
+            'ready': state.version == get_version(self.namespace),
+            'bits': state.size,
+            'hashes': state.hashes,
+            'capacity': state.capacity,
+            'items': state.items,
+            'memory_bytes': len(state.bits.bytes),
+        }
+
+
+# KEYS meta, bits; ARGV generation, offsets. -1 when the filter is not usable
+PROBE_SCRIPT = """
+local meta = redis.call('HMGET', KEYS[1], 'generation', 'ready', 'items', 'capacity')
+if meta[1] ~= ARGV[1] or meta[2] ~= '1' or tonumber(meta[3]) > tonumber(meta[4]) then
+    return -1
+end
+for i = 2, #ARGV do
+    if redis.call('GETBIT', KEYS[2], ARGV[i]) == 0 then
+        return 0
+    end
+end
+return 1
+"""
+
+# KEYS meta, bits; ARGV generation, offsets
+ADD_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'generation') ~= ARGV[1] then
+    return 0
+end
+for i = 2, #ARGV do
+    redis.call('SETBIT', KEYS[2], ARGV[i], 1)
+end
+redis.call('HINCRBY', KEYS[1], 'items', 1)
+return 1
+"""
+
+# KEYS meta, bits, scanned bits; ARGV generation, scanned values.
+# OR keeps the bits writers set while the scan ran
+FINISH_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'generation') ~= ARGV[1] then
+    redis.call('DEL', KEYS[3])
+    return 0
+end
+redis.call('BITOP', 'OR', KEYS[2], KEYS[2], KEYS[3])
+redis.call('DEL', KEYS[3])
+redis.call('HINCRBY', KEYS[1], 'items', ARGV[2])
+redis.call('HSET', KEYS[1], 'ready', 1)
+return 1
+"""
+
+
+class RedisBloom(object):
+    """
+    Filter in a Redis bitmap shared by every process, probed and updated
+    with one script call. A build writes a new generation: the parameters
+    are published before the scan so writes committed meanwhile land in
+    the new bitmap, and the filter is only used once the scan is merged.
+    """
+    kind = 'redis'
+
+    def __init__(self, membership):
+        self.membership = membership
+        self.meta_key = 'bloom:%s:meta' % membership.name
+        self.lock_key = 'bloom:%s:lock' % membership.name
+        self.meta = None
+        self.scripts = None
+
+    def bits_key(self, generation):
+        return 'bloom:%s:bits:%s' % (self.membership.name, generation)
+
+    def get_connection(self):
+        # django_redis is only installed where REDIS_URL is used
+        from django_redis import get_redis_connection
+
+        return get_redis_connection('default')
+
+    def get_scripts(self):
+        if self.scripts is None:
+            redis = self.get_connection()
+            self.scripts = {name: redis.register_script(script) for name, script in (
+                ('probe', PROBE_SCRIPT), ('add', ADD_SCRIPT), ('finish', FINISH_SCRIPT))}
+        return self.scripts
+
+    def load_meta(self):
+        generation, size, hashes = self.get_connection().hmget(self.meta_key, 'generation', 'size', 'hashes')
+        self.meta = (generation.decode(), int(size), int(hashes)) if generation is not None else None
+        return self.meta
+
+    def call(self, name, value, meta):
+        generation, size, hashes = meta
+        return self.get_scripts()[name](keys=[self.meta_key, self.bits_key(generation)],
+                                        args=[generation] + bit_offsets(value, size, hashes))
+
+    def probe(self, value):
+        try:
+            meta = self.meta or self.load_meta()
+            answer = self.call('probe', value, meta) if meta is not None else -1
+            if answer == -1 and self.meta is not None:
+                # rebuilt by another process since the parameters were read
+                meta = self.load_meta()
+                answer = self.call('probe', value, meta) if meta is not None else -1
+        except Exception:
+            logger.warning('Redis bloom filter %s failed', self.membership.name, exc_info=True)
+            return None
+        return None if answer == -1 else bool(answer)
+
+    def add(self, value):
+        try:
+            # parameters read after the commit, a build starting later scans the row
+            meta = self.load_meta()
+            if meta is not None and not self.call('add', value, meta):
+                meta = self.load_meta()
+                if meta is not None:
+                    self.call('add', value, meta)
+        except Exception:
+            # the filter would miss a value it must report, drop it
+            logger.warning('Redis bloom filter %s failed, resetting it', self.membership.name, exc_info=True)
+            self.reset()
+
+    def build(self):
+        redis = self.get_connection()
+        token = uuid.uuid4().hex
+        if not redis.set(self.lock_key, token, nx=True, ex=settings.BLOOM_BUILD_TIMEOUT):
+            return False
+        try:
+            previous = redis.hget(self.meta_key, 'generation')
+            size, hashes, capacity = self.membership.get_size()
+            generation = token
+            pipe = redis.pipeline()
+            pipe.delete(self.meta_key)
+            if previous is not None:
+                pipe.delete(self.bits_key(previous.decode()))
+            pipe.hset(self.meta_key, mapping={'generation': generation, 'size': size, 'hashes': hashes,
+                                              'capacity': capacity, 'items': 0, 'ready': 0})
+            pipe.execute()
+
+            bits = BitArray(size)
+            items = 0
+            for value in self.membership.scan():
+                bits.set(bit_offsets(value, size, hashes))
+                items += 1
+            scanned_key = '%s:scan' % self.bits_key(generation)
+            redis.set(scanned_key, bytes(bits.bytes), ex=settings.BLOOM_BUILD_TIMEOUT)
+            return bool(self.get_scripts()['finish'](
+                keys=[self.meta_key, self.bits_key(generation), scanned_key], args=[generation, items]))
+        finally:
+            if redis.get(self.lock_key) == token.encode():
+                redis.delete(self.lock_key)
+
+    def reset(self):
+        try:
+            redis = self.get_connection()
+            generation = redis.hget(self.meta_key, 'generation')
+            if generation is not None:
+                redis.delete(self.meta_key, self.bits_key(generation.decode()))
+        except Exception:
+            logger.error('Redis bloom filter %s could not be reset', self.membership.name, exc_info=True)
+
+    def stats(self):
+        redis = self.get_connection()
+        meta = {key.decode(): value.decode() for key, value in redis.hgetall(self.meta_key).items()}
+        if not meta:
+            return {'ready': False}
+        return {
+            'ready': meta['ready'] == '1',
+            'bits': int(meta['size']),
+            'hashes': int(meta['hashes']),
+            'capacity': int(meta['capacity']),
+            'items': int(meta['items']),
+            'memory_bytes': redis.strlen(self.bits_key(meta['generation'])),
+        }
+
+
+BACKENDS = {'local': LocalBloom, 'redis': RedisBloom}
+
+FILTERS = {}
+
+
+class MembershipFilter(object):
+    """
+    Bloom filter in front of an existence check on a model field. A miss
+    is final, a possible hit is confirmed with an indexed EXISTS. The
+    filter is built from the database in a background thread on first use,
+    and again once it is stale or over capacity, checks go to the database
+    meanwhile. Saved instances are added once their transaction commits;
+    deleted or renamed values stay in as false positives. Writes that skip
+    post_save (bulk_create, update, COPY) must call reset(). With
+    BLOOM_BACKEND 'off' every check goes to the database.
+    """
+
+    def __init__(self, name, model, field):
+        self.name = name
+        self.model = model
+        self.field = field
+        self.backend = None
+        self.lock = threading.Lock()
+        self.building = False
+        self.build_started = None
+        FILTERS[name] = self
+        post_save.connect(self.saved, sender=model, weak=False, dispatch_uid='bloom:%s' % name)
+
+    def get_backend(self):
+        """The filter backend, None when BLOOM_BACKEND is 'off'."""
+        if settings.BLOOM_BACKEND == 'off':
+            return None
+        if self.backend is None:
+            if settings.BLOOM_BACKEND == 'local' and not is_shared_cache():
+                raise ImproperlyConfigured(
+                    "BLOOM_BACKEND 'local' needs a cache shared by the processes, "
+                    "%s is not" % caches['default'].__class__.__name__)
+            self.backend = BACKENDS[settings.BLOOM_BACKEND](self)
+        return self.backend
+
+    def get_size(self):
+        """(bits, hashes, capacity), with room for BLOOM_GROWTH times the current rows."""
+        count = self.model._default_manager.using(DEFAULT_DB_ALIAS).count()
+        capacity = max(settings.BLOOM_MIN_CAPACITY, int(count * settings.BLOOM_GROWTH))
+        return optimal_size(capacity, settings.BLOOM_ERROR_RATE) + (capacity,)
+
+    def scan(self):
+        # the primary, a lagging replica would leave out recent rows
+        return (self.model._default_manager.using(DEFAULT_DB_ALIAS)
+                .filter(**{'%s__isnull' % self.field: False})
+                .values_list(self.field, flat=True).iterator(chunk_size=settings.BLOOM_BUILD_CHUNK))
+
+    def get_queryset(self, value):
+        return self.model._default_manager.filter(**{self.field: value})
+
+    def probe(self, value):
+        """False when value is certainly absent, None when the database must tell."""
+        backend = self.get_backend()
+        if backend is None:
+            return None
+        answer = backend.probe(value)
+        if answer is None:
+            self.schedule_build()
+        elif answer is False:
+            metrics.BLOOM_CHECKS.inc((self.name, 'miss'))
+            return False
+        return None if answer is None else True
+
+    def record(self, answer, found):
+        if self.get_backend() is None:
+            return
+        if answer is None:
+            result = 'unavailable'
+        else:
+            result = 'hit' if found else 'false_positive'
+        metrics.BLOOM_CHECKS.inc((self.name, result))
+
+    def exists(self, value):
+        answer = self.probe(value)
+        if answer is False:
+            return False
+        found = self.get_queryset(value).exists()
+        self.record(answer, found)
+        return found
+
+    async def aexists(self, value):
+        # imported here, utils.db.aio must not load with the models
+        from utils.db.aio import get_database
+
+        # the probe reads the cache or Redis, a blocking client
+        answer = await sync_to_async(self.probe, thread_sensitive=False)(value)
+        if answer is False:
+            return False
+        queryset = self.get_queryset(value)
+        found = await get_database(queryset.db).exists(queryset)
+        self.record(answer, found)
+        return found
+
+    def saved(self, sender, instance, using=None, update_fields=None, **kwargs):
+        if update_fields is not None and self.field not in update_fields:
+            return
+        backend = self.get_backend()
+        value = getattr(instance, self.field)
+        if backend is not None and value:
+            transaction.on_commit(lambda: backend.add(value), using=using)
+
+    def schedule_build(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.building or (self.build_started is not None
+                                 and now - self.build_started < settings.BLOOM_REBUILD_INTERVAL):
+                return
+            self.building = True
+            self.build_started = now
+        threading.Thread(target=self.run_build, name='bloom-%s' % self.name, daemon=True).start()
+
+    def run_build(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Building bloom filter %s failed', self.name)
+        finally:
+            self.building = False
+            connections.close_all()
+
+    def build(self):
+        """Fill the filter from the database. False when another process is building it or it is off."""
+        if self.get_backend() is None:
+            return False
+        started = time.perf_counter()
+        built = self.get_backend().build()
+        if built:
+            logger.info('Bloom filter %s built in %.1fs', self.name, time.perf_counter() - started)
+        return built
+
+    def reset(self):
+        """Forget the filter, the next check rebuilds it."""
+        if self.get_backend() is not None:
+            self.get_backend().reset()
+
+    def stats(self):
+        backend = self.get_backend()
+        data = {'name': self.name, 'backend': backend.kind if backend is not None else 'off'}
+        data.update(backend.stats() if backend is not None else {'ready': False})
+        if data.get('items') is not None:
+            data['expected_error_rate'] = round(expected_error_rate(data['bits'], data['hashes'], data['items']), 6)
+        counts = {result: metrics.BLOOM_CHECKS.values.get((self.name, result), 0)
+                  for result in ('miss', 'hit', 'false_positive', 'unavailable')}
+        data['checks'] = counts
+        # misses plus false positives are the absent values the filter saw
+        absent = counts['miss'] + counts['false_positive']
+        data['observed_error_rate'] = round(counts['false_positive'] / absent, 6) if absent else None
+        return data
+
+
+def get_stats():
+    return [membership.stats() for membership in FILTERS.values()]
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from rest_framework import status
+from rest_framework.response import Response
+
+from utils.dbrouter import read_primary
+
+CATALOG_CACHE = 'catalog'
+
+DEFAULT_CACHE_QUERY_PARAMS = ('ordering', 'page', 'limit', 'cursor')
+
+
+# caches that do not reach the other processes
+PROCESS_CACHES = (LocMemCache, DummyCache)
+
+
+def is_shared_cache():
+    """
+    Whether the default cache is seen by every process. Namespace versions
+    only invalidate other workers when it is; LocMemCache keeps a copy per
+    process.
+    """
+    return not isinstance(caches['default'], PROCESS_CACHES)
+
+
+def _version_key(namespace):
+    return 'version:%s' % namespace
+
+
+def _stats_key(namespace, name):
+    return 'stats:%s:%s' % (namespace, name)
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key)
+
+
+def get_version(namespace):
+    """
+    Current version of a cache namespace.
+
+    A missing version (first use or evicted) restarts from the clock in
+    milliseconds, so it can never fall back onto entries written under an
+    older version.
+    """
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """Invalidate every entry of a namespace at once."""
+    try:
+        return cache.incr(_version_key(namespace))
+    except ValueError:
+        return get_version(namespace)
+
+
+def invalidate_on_commit(namespace):
+    """Bump the namespace version once the current transaction commits."""
+    transaction.on_commit(lambda: bump_version(namespace))
+
+
+def invalidate_on_save(namespace, model, fields=None):
+    """
+    Invalidate the namespace whenever an instance of model is saved or
+    deleted. With fields, saves limited by update_fields to other fields
+    are ignored (e.g. last_login).
+    """
+
+    def saved(sender, instance, using=None, update_fields=None, **kwargs):
+        if fields is not None and update_fields is not None and not set(update_fields) & set(fields):
+            return
+        transaction.on_commit(lambda: bump_version(namespace), using=using)
+
+    uid = 'cache:%s:%s' % (namespace, model._meta.label)
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=uid + ':save')
+    post_delete.connect(saved, sender=model, weak=False, dispatch_uid=uid + ':delete')
+
+
+def get_stats(namespace):
+    hit = cache.get(_stats_key(namespace, 'hit'), 0)
+    miss = cache.get(_stats_key(namespace, 'miss'), 0)
+    total = hit + miss
+    return {
+        'version': get_version(namespace),
+        'hit': hit,
+        'miss': miss,
+        'hit_ratio': round(hit / total, 4) if total else None,
+    }
+
+
+def get_cache_query_params(view):
+    params = set(getattr(view, 'cache_query_params', DEFAULT_CACHE_QUERY_PARAMS))
+    filterset_class = getattr(view, 'filterset_class', None)
+    if filterset_class is not None:
+        params.update(filterset_class.base_filters)
+    return params
+
+
+def build_cache_key(namespace, view, request):
+    """
+    Key on the view, its url kwargs and the known query parameters only,
+    sorted and without empty values, so ?b=1&a=2 and ?a=2&b=1&_=123 share
+    one entry.
+    """
+    allowed = get_cache_query_params(view)
+    params = sorted(
+        (name, sorted(value for value in request.query_params.getlist(name) if value != ''))
+        for name in request.query_params if name in allowed
+    )
+    params = [(name, values) for name, values in params if values]
+    raw = json.dumps([view.__class__.__name__, sorted(view.kwargs.items()), params])
+    digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    return 'response:%s:%s:%s' % (namespace, get_version(namespace), digest)
+
+
+def get_cached_response(namespace, view, request):
+    """Return (cache key, cached Response or None) and count the hit or miss."""
+    key = build_cache_key(namespace, view, request)
+    data = cache.get(key)
+    if data is not None:
+        _incr(_stats_key(namespace, 'hit'))
+        return key, Response(data=data, status=status.HTTP_200_OK)
+    _incr(_stats_key(namespace, 'miss'))
+    return key, None
+
+
+def store_response(key, response, timeout=None):
+    if response.status_code == status.HTTP_200_OK:
+        cache_timeout = timeout if timeout is not None else settings.CATALOG_CACHE_TIMEOUT
+        cache.set(key, response.data, cache_timeout)
+
+
+def cache_response(namespace, timeout=None):
+    """
+    Cache the data of a successful GET handler under the namespace version.
+    Runs after authentication and permission checks. Off without a shared
+    cache, a write would not invalidate the other processes.
+    """
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            if not is_shared_cache():
+                return handler(view, request, *args, **kwargs)
+            key, response = get_cached_response(namespace, view, request)
+            if response is None:
+                # filled from the primary, a lagging replica would cache rows older than the version
+                with read_primary():
+                    response = handler(view, request, *args, **kwargs)
+                store_response(key, response, timeout)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def acache_response(namespace, timeout=None):
+    """
+    cache_response for the coroutine handlers of async views, same keys.
+    The cache client blocks, so its calls run on a worker thread.
+    """
+
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(view, request, *args, **kwargs):
+            if not is_shared_cache():
+                return await handler(view, request, *args, **kwargs)
+            key, response = await sync_to_async(get_cached_response, thread_sensitive=False)(
+                namespace, view, request)
+            if response is None:
+                with read_primary():
+                    response = await handler(view, request, *args, **kwargs)
+                await sync_to_async(store_response, thread_sensitive=False)(key, response, timeout)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,127 @@
+import calendar
+import hashlib
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+
+from utils.cache import CATALOG_CACHE, get_version, is_shared_cache
+from utils.db.aio import get_database
+
+
+def get_validator_queryset(view):
+    if hasattr(view, 'get_validator_queryset'):
+        return view.get_validator_queryset()
+    return view.filter_queryset(view.get_queryset())
+
+
+def get_validator(view):
+    """
+    max(updated_at) of the rows the request would return, without loading
+    a single row. No COUNT with a shared cache: inserts and deletes bump
+    the catalog version, which is part of the ETag. A per process cache
+    does not see the bumps of other workers, the row count stands in.
+    """
+    queryset = get_validator_queryset(view).order_by()
+    if is_shared_cache():
+        return queryset.aggregate(last_modified=Max('updated_at'))
+    return queryset.aggregate(last_modified=Max('updated_at'), count=Count('*'))
+
+
+async def aget_validator(view):
+    """get_validator for async views, run on utils.db.aio."""
+    queryset = get_validator_queryset(view)
+    database = get_database(queryset.db)
+    compiled = database.compile(queryset.order_by().values('updated_at'))
+    if compiled is None:
+        return {'last_modified': None} if is_shared_cache() else {'last_modified': None, 'count': 0}
+    if is_shared_cache():
+        last_modified, = await database.fetchone(
+            'SELECT MAX(updated_at) FROM (%s) validator' % compiled[0], compiled[1])
+        return {'last_modified': last_modified}
+    last_modified, count = await database.fetchone(
+        'SELECT MAX(updated_at), COUNT(*) FROM (%s) validator' % compiled[0], compiled[1])
+    return {'last_modified': last_modified, 'count': count}
+
+
+def build_etag(view, request, validator):
+    last_modified = validator['last_modified']
+    params = sorted((name, request.query_params.getlist(name)) for name in request.query_params)
+    raw = json.dumps([
+        view.__class__.__name__,
+        sorted(view.kwargs.items()),
+        params,
+        getattr(request.user, 'id', None),
+        last_modified.isoformat() if last_modified else None,
+        # bumped by every catalog write, deletes and joined data (e.g. author username) included;
+        # only other workers see it in a shared cache
+        get_version(CATALOG_CACHE) if 'count' not in validator else validator['count'],
+    ])
+    return quote_etag(hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    if if_modified_since is not None and last_modified is not None:
+        return int(calendar.timegm(last_modified.utctimetuple())) <= if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(calendar.timegm(last_modified.utctimetuple()))
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def conditional_response(handler):
+    """
+    Answer GET handlers with strong ETag / Last-Modified validators and
+    304 Not Modified when the client copy is still current.
+    """
+
+    @wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        validator = get_validator(view)
+        etag = build_etag(view, request, validator)
+        last_modified = validator['last_modified']
+
+        if is_not_modified(request, etag, last_modified):
+            response = HttpResponseNotModified()
+        else:
+            response = handler(view, request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
+    return wrapper
+
+
+def aconditional_response(handler):
+    """conditional_response for the coroutine handlers of async views."""
+
+    @wraps(handler)
+    async def wrapper(view, request, *args, **kwargs):
+        validator = await aget_validator(view)
+        # get_version reads the cache, a blocking call
+        etag = await sync_to_async(build_etag, thread_sensitive=False)(view, request, validator)
+        last_modified = validator['last_modified']
+
+        if is_not_modified(request, etag, last_modified):
+            response = HttpResponseNotModified()
+        else:
+            response = await handler(view, request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
+    return wrapper
@@ -0,0 +1,115 @@
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+class ExactCount(object):
+    """SELECT COUNT(*) on every request."""
+
+    def count(self, queryset):
+        return queryset.count(), False
+
+    async def acount(self, queryset, database):
+        return await database.count(queryset), False
+
+
+class KnownCount(object):
+    """A total computed beforehand, e.g. asynchronously by an async view."""
+
+    def __init__(self, value, approximate=False):
+        self.value = value
+        self.approximate = approximate
+
+    def count(self, queryset):
+        return self.value, self.approximate
+
+
+class CachedCount(object):
+    """
+    Exact count cached for `timeout` seconds per filter signature (the SQL
+    and parameters of the filtered queryset). Counts read from the cache
+    are flagged approximate, they can be up to `timeout` seconds old.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def get_cache_key(self, queryset):
+        sql, params = queryset.order_by().query.sql_with_params()
+        raw = json.dumps([queryset.db, sql, [str(param) for param in params]])
+        return 'count:%s' % hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def count(self, queryset):
+        key = self.get_cache_key(queryset)
+        value = cache.get(key)
+        if value is not None:
+            return value, True
+        value = queryset.count()
+        self.store(key, value)
+        return value, False
+
+    async def acount(self, queryset, database):
+        key = self.get_cache_key(queryset)
+        # the cache client blocks, keep it off the event loop
+        value = await sync_to_async(cache.get, thread_sensitive=False)(key)
+        if value is not None:
+            return value, True
+        value = await database.count(queryset)
+        await sync_to_async(self.store, thread_sensitive=False)(key, value)
+        return value, False
+
+    def store(self, key, value):
+        timeout = self.timeout if self.timeout is not None else settings.COUNT_CACHE_TIMEOUT
+        cache.set(key, value, timeout)
+
+
+class EstimatedCount(object):
+    """
+    Planner estimate instead of COUNT(*) for large sets: pg_class.reltuples
+    for an unfiltered table, the row estimate of EXPLAIN otherwise. Below
+    `threshold` estimated rows the exact count is cheap and is used instead.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold
+
+    def get_estimate_query(self, queryset):
+        if not queryset.query.where:
+            return 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table]
+        sql, params = queryset.order_by().query.sql_with_params()
+        return 'EXPLAIN (FORMAT JSON) ' + sql, params
+
+    def parse_estimate(self, queryset, row):
+        if not queryset.query.where:
+            return int(row[0]) if row else -1
+        plan = row[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def estimate(self, queryset):
+        connection = connections[queryset.db]
+        with connection.cursor() as cursor:
+            cursor.execute(*self.get_estimate_query(queryset))
+            return self.parse_estimate(queryset, cursor.fetchone())
+
+    def get_threshold(self):
+        return self.threshold if self.threshold is not None else settings.COUNT_ESTIMATE_THRESHOLD
+
+    def count(self, queryset):
+        estimate = self.estimate(queryset)
+        # reltuples is -1 (or 0) until the table is first analyzed
+        if estimate < self.get_threshold():
+            return queryset.count(), False
+        return estimate, True
+
+    async def acount(self, queryset, database):
+        row = await database.fetchone(*self.get_estimate_query(queryset))
+        estimate = self.parse_estimate(queryset, row)
+        if estimate < self.get_threshold():
+            return await database.count(queryset), False
+        return estimate, True
@@ -1,29 +1,138 @@
-from django.db import connection
+import asyncio
+import time
 
-class QueryCountDebugMiddleware(object):
-    """Debug query count - use for DEBUG only."""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from utils import dbrouter, metrics, slowqueries
+
+
+class AsyncCapableMiddleware(object):
     """
-    This middleware will log the number of queries run
-    and the total time taken for each request (with a
-    status code of 200). It does not currently support
-    multi-db setups.
+    Middleware usable in front of both sync and async views. Under ASGI
+    Django then awaits it directly instead of running it, and every view
+    behind it, on its sync thread.
     """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # what Django checks to call the instance as a coroutine
+            self._is_coroutine = asyncio.coroutines._is_coroutine
 
     def __call__(self, request):
-        response = self.get_response(request)
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Record latency, database statements and time, serializer time and
+    response size per route into utils.metrics, exposed on /metrics.
+    Statements are timed by an execute wrapper on every connection, so
+    DEBUG is not needed; slow ones also go to utils.slowqueries.
+    """
+
+    def __init__(self, get_response):
+        super(MetricsMiddleware, self).__init__(get_response)
+        connection_created.connect(metrics.install_query_timer, dispatch_uid='metrics.install_query_timer')
+        connection_created.connect(slowqueries.install_recorder, dispatch_uid='slowqueries.install_recorder')
+
+    def handle(self, request):
+        request_metrics, token = metrics.start_request(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        metrics.observe_request(request, response, request_metrics, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        request_metrics, token = metrics.start_request(request)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        metrics.observe_request(request, response, request_metrics, time.perf_counter() - started)
+        return response
+
+
+class ReplicaRoutingMiddleware(AsyncCapableMiddleware):
+    """
+    Read safe-method requests from the replicas (utils.dbrouter.ReplicaRouter).
+    A client that wrote in the last DATABASE_REPLICA_LAG_WINDOW seconds
+    keeps reading the primary so it sees its own writes.
+    """
+
+    def __init__(self, get_response):
+        super(ReplicaRoutingMiddleware, self).__init__(get_response)
+        self.authentication = JWTAuthentication()
+
+    def get_client(self, request):
+        header = self.authentication.get_header(request)
+        raw_token = self.authentication.get_raw_token(header) if header else None
+        if raw_token is not None:
+            try:
+                token = self.authentication.get_validated_token(raw_token)
+            except InvalidToken:
+                pass
+            else:
+                user_id = token.get(jwt_settings.USER_ID_CLAIM)
+                if user_id is not None:
+                    return 'user:%s' % user_id
+        return 'ip:%s' % request.META.get('REMOTE_ADDR')
+
+    def begin(self, request):
+        client = self.get_client(request)
+        safe = request.method in SAFE_METHODS
+        state = dbrouter.RoutingState(use_replica=safe and not dbrouter.has_recent_write(client))
+        return client, state
+
+    def finish(self, request, response, client, state):
+        if response.streaming:
+            response.streaming_content = dbrouter.iterate_with_state(state, response.streaming_content)
+        if state.wrote or request.method not in SAFE_METHODS:
+            dbrouter.mark_recent_write(client)
+        return response
 
-        total_time = 0
+    def handle(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
 
-        for query in connection.queries:
-            query_time = query.get('time')
-            # print(str(query))
+        client, state = self.begin(request)
+        token = dbrouter.set_state(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            dbrouter.reset_state(token)
+        return self.finish(request, response, client, state)
 
-            if query_time is None:
-                query_time = query.get('duration', 0) / 1000
-            total_time += float(query_time)
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
 
-        print('%s queries run, total %s seconds' % (len(connection.queries), total_time))
-        return response
\ No newline at end of file
+        # the recent write marker lives in the cache, a blocking client
+        client, state = await sync_to_async(self.begin, thread_sensitive=False)(request)
+        # sync views run on Django's thread with a copy of this context
+        token = dbrouter.set_state(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            dbrouter.reset_state(token)
+        return await sync_to_async(self.finish, thread_sensitive=False)(request, response, client, state)
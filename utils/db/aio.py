@@ -0,0 +1,205 @@
+import asyncio
+import collections
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+import psycopg2
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Prefetch
+from django.db.models.fields.related_descriptors import ReverseManyToOneDescriptor
+from django.db.models.query import get_related_populators
+from psycopg2 import extensions
+
+from utils import metrics, slowqueries
+from utils.querybudget import record_async_query
+
+# event loop -> {alias: AsyncDatabase}
+_databases = weakref.WeakKeyDictionary()
+
+
+async def wait(connection):
+    """Drive an asynchronous psycopg2 connection until the pending operation is done."""
+    loop = asyncio.get_event_loop()
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            return
+        waiter = loop.create_future()
+
+        def ready():
+            if not waiter.done():
+                waiter.set_result(None)
+
+        fd = connection.fileno()
+        if state == extensions.POLL_READ:
+            loop.add_reader(fd, ready)
+            remove = loop.remove_reader
+        elif state == extensions.POLL_WRITE:
+            loop.add_writer(fd, ready)
+            remove = loop.remove_writer
+        else:
+            raise psycopg2.OperationalError('Unexpected poll state %s' % state)
+        try:
+            await waiter
+        finally:
+            remove(fd)
+
+
+class AsyncDatabase(object):
+    """
+    Read-only access to a database alias from async views, over
+    asynchronous psycopg2 connections (always autocommit) kept in a small
+    pool bound to the running event loop.
+
+    Querysets are compiled with the Django compiler of the alias and rows
+    are turned back into model instances the way ModelIterable does,
+    select_related included. Reverse foreign key prefetches are supported.
+    """
+
+    def __init__(self, alias, size):
+        self.alias = alias
+        self.semaphore = asyncio.Semaphore(size)
+        self.idle = []
+
+    @property
+    def wrapper(self):
+        return connections[self.alias]
+
+    def get_connection_params(self):
+        params = self.wrapper.get_connection_params()
+        if settings.USE_TZ:
+            params['options'] = ('%s -c TimeZone=UTC' % params.get('options', '')).strip()
+        params.setdefault('client_encoding', 'UTF8')
+        return params
+
+    async def connect(self):
+        connection = psycopg2.connect(async_=1, **self.get_connection_params())
+        await wait(connection)
+        return connection
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self.semaphore:
+            connection = self.idle.pop() if self.idle else await self.connect()
+            try:
+                yield connection
+            except BaseException:
+                # cancelled or failed mid statement, the connection may still be busy
+                try:
+                    connection.cancel()
+                except psycopg2.Error:
+                    pass
+                connection.close()
+                raise
+            if not connection.closed:
+                self.idle.append(connection)
+
+    async def execute(self, sql, params=None):
+        with self.wrapper.wrap_database_errors:
+            async with self.connection() as connection:
+                cursor = connection.cursor()
+                started = time.perf_counter()
+                try:
+                    cursor.execute(sql, params)
+                    await wait(connection)
+                    return cursor.fetchall() if cursor.description else []
+                finally:
+                    cursor.close()
+                    duration = time.perf_counter() - started
+                    metrics.record_query(duration)
+                    record_async_query()
+                    slowqueries.record(sql, params, duration)
+
+    async def fetchone(self, sql, params=None):
+        rows = await self.execute(sql, params)
+        return rows[0] if rows else None
+
+    def compile(self, queryset):
+        """SQL and parameters of a queryset, None when it cannot match any row."""
+        try:
+            return queryset.query.get_compiler(self.alias).as_sql()
+        except EmptyResultSet:
+            return None
+
+    async def count(self, queryset):
+        compiled = self.compile(queryset.order_by().values('pk'))
+        if compiled is None:
+            return 0
+        row = await self.fetchone('SELECT COUNT(*) FROM (%s) subquery' % compiled[0], compiled[1])
+        return row[0]
+
+    async def exists(self, queryset):
+        compiled = self.compile(queryset.order_by().values('pk')[:1])
+        return compiled is not None and bool(await self.execute(*compiled))
+
+    async def fetch(self, queryset):
+        """Evaluate a model queryset, like list(queryset)."""
+        compiler = queryset.query.get_compiler(self.alias)
+        try:
+            sql, params = compiler.as_sql()
+        except EmptyResultSet:
+            return []
+        rows = await self.execute(sql, params)
+        if compiler.has_extra_select:
+            rows = [row[:compiler.col_count] for row in rows]
+
+        select, klass_info, annotation_col_map = compiler.select, compiler.klass_info, compiler.annotation_col_map
+        model_cls = klass_info['model']
+        select_fields = klass_info['select_fields']
+        start, end = select_fields[0], select_fields[-1] + 1
+        init_list = [column[0].target.attname for column in select[start:end]]
+        related_populators = get_related_populators(klass_info, select, self.alias)
+
+        instances = []
+        for row in compiler.results_iter([rows]):
+            instance = model_cls.from_db(self.alias, init_list, row[start:end])
+            for populator in related_populators:
+                populator.populate(row, instance)
+            for name, position in annotation_col_map.items():
+                setattr(instance, name, row[position])
+            instances.append(instance)
+
+        if instances and queryset._prefetch_related_lookups:
+            await self.prefetch(instances, queryset._prefetch_related_lookups)
+        return instances
+
+    async def prefetch(self, instances, lookups):
+        model = instances[0].__class__
+        for lookup in lookups:
+            if not isinstance(lookup, Prefetch):
+                lookup = Prefetch(lookup)
+            descriptor = getattr(model, lookup.prefetch_through, None)
+            if '__' in lookup.prefetch_through or lookup.to_attr or \
+                    not isinstance(descriptor, ReverseManyToOneDescriptor) or descriptor.rel.many_to_many:
+                raise NotImplementedError(
+                    'Only reverse foreign key prefetches are supported, not %r' % lookup.prefetch_through)
+
+            field = descriptor.rel.field
+            keys = {getattr(instance, field.target_field.attname) for instance in instances}
+            queryset = lookup.queryset if lookup.queryset is not None else field.model._default_manager.all()
+            related = await self.fetch(queryset.filter(**{field.name + '__in': keys}))
+
+            grouped = collections.defaultdict(list)
+            for obj in related:
+                grouped[getattr(obj, field.attname)].append(obj)
+            cache_name = field.remote_field.get_cache_name()
+            for instance in instances:
+                objs = grouped[getattr(instance, field.target_field.attname)]
+                for obj in objs:
+                    field.set_cached_value(obj, instance)
+                # what prefetch_related_objects leaves behind
+                manager_queryset = getattr(instance, lookup.prefetch_through).get_queryset()
+                manager_queryset._result_cache = objs
+                manager_queryset._prefetch_done = True
+                instance.__dict__.setdefault('_prefetched_objects_cache', {})[cache_name] = manager_queryset
+
+
+def get_database(alias=DEFAULT_DB_ALIAS):
+    loop = asyncio.get_event_loop()
+    databases = _databases.setdefault(loop, {})
+    if alias not in databases:
+        databases[alias] = AsyncDatabase(alias, settings.ASYNC_DATABASE_POOL_SIZE)
+    return databases[alias]
@@ -0,0 +1,40 @@
+from django.db.backends.postgresql import base
+
+from utils.db.pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend that borrows connections from a per-process pool
+    (utils.db.pool) and gives them back when Django closes them, at the end
+    of every request. Pool options go in the POOL key of the database
+    settings, CONN_MAX_AGE should stay 0.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        self.used_named_cursor = False
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict.get('POOL') or {})
+
+    def get_new_connection(self, conn_params):
+        parent = super(DatabaseWrapper, self)
+        return self.pool.acquire(lambda: parent.get_new_connection(conn_params))
+
+    def create_cursor(self, name=None):
+        if name:
+            self.used_named_cursor = True
+        return super(DatabaseWrapper, self).create_cursor(name)
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # still referenced by the wrapper until the atomic block exits
+                self.pool.discard(self.connection)
+            else:
+                self.pool.release(self.connection, reset=self.used_named_cursor)
+        self.used_named_cursor = False
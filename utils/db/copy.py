@@ -0,0 +1,79 @@
+import datetime
+import uuid
+
+from django.db import connection as default_connection
+
+# text format of COPY, see https://www.postgresql.org/docs/current/sql-copy.html
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def format_array_item(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return '"%s"' % str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def format_value(value):
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (list, tuple)):
+        value = '{%s}' % ','.join(format_array_item(item) for item in value)
+    elif isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    elif isinstance(value, uuid.UUID):
+        return str(value)
+    return str(value).translate(_ESCAPES)
+
+
+class IteratorFile(object):
+    """
+    Read-only file over an iterator of rows, formatted as COPY text lines
+    on demand so cursor.copy_expert() streams any number of rows without
+    building them in memory first.
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        for row in self.rows:
+            line = '\t'.join(format_value(value) for value in row) + '\n'
+            chunks.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        data = ''.join(chunks)
+        if size < 0:
+            self.buffer = ''
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def copy_rows(table, columns, rows, connection=None):
+    """COPY an iterable of value tuples into table, returns the number of rows written."""
+    connection = connection or default_connection
+    quote_name = connection.ops.quote_name
+    sql = 'COPY %s (%s) FROM STDIN' % (quote_name(table), ', '.join(quote_name(column) for column in columns))
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, IteratorFile(rows))
+        return cursor.rowcount
+
+
+def reset_sequence(table, column='id', connection=None):
+    """Move the serial sequence of table past the explicit ids written by COPY."""
+    connection = connection or default_connection
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT setval(pg_get_serial_sequence(%%s, %%s), COALESCE(MAX(%s), 1), MAX(%s) IS NOT NULL) FROM %s'
+            % (quote_name(column), quote_name(column), quote_name(table)), [table, column])
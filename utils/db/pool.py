@@ -0,0 +1,218 @@
+import collections
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+PooledConnection = collections.namedtuple('PooledConnection', 'connection created generation released')
+
+
+class ConnectionPool(object):
+    """
+    Process wide pool of psycopg2 connections for one database alias.
+
+    max_size        connections open at the same time, checked out or idle
+    idle_timeout    seconds an idle connection is kept
+    max_lifetime    seconds after which a connection is replaced
+    pre_ping        run SELECT 1 before handing out an idle connection
+    timeout         seconds to wait for a free connection when the pool is full
+
+    A broken connection (failover, restart, network) flushes every idle
+    connection and retires the checked out ones, they point at the same
+    server.
+    """
+
+    def __init__(self, alias, max_size=10, idle_timeout=300, max_lifetime=3600, pre_ping=True, timeout=10):
+        self.alias = alias
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.idle = []
+        self.checked_out = {}
+        # slots reserved by threads opening a new connection
+        self.opening = 0
+        self.generation = 0
+        self.counters = collections.Counter()
+
+    def _check_pid(self):
+        # connections opened before a fork belong to the parent, closing them
+        # here would end its sessions, so they are only forgotten
+        if self.pid != os.getpid():
+            self._reset()
+
+    def _is_expired(self, entry, now):
+        if entry.generation != self.generation:
+            return 'failover'
+        if now - entry.created > self.max_lifetime:
+            return 'lifetime'
+        if now - entry.released > self.idle_timeout:
+            return 'idle'
+        return None
+
+    def _discard(self, connection, reason):
+        self.counters['discarded_%s' % reason] += 1
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _ping(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self, connect):
+        """Return an idle connection, or one opened with connect()."""
+        deadline = time.monotonic() + self.timeout
+        entry = None
+        with self.condition:
+            self._check_pid()
+            while True:
+                now = time.monotonic()
+                while self.idle:
+                    # most recently used first, the rest ages out
+                    candidate = self.idle.pop()
+                    reason = self._is_expired(candidate, now)
+                    if reason:
+                        self._discard(candidate.connection, reason)
+                    else:
+                        entry = candidate
+                        break
+                if entry is not None:
+                    self.checked_out[id(entry.connection)] = entry
+                    break
+                if len(self.checked_out) + self.opening < self.max_size:
+                    self.opening += 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise psycopg2.OperationalError(
+                        'connection pool %r exhausted (%s connections)' % (self.alias, self.max_size))
+                self.counters['waits'] += 1
+                self.condition.wait(remaining)
+
+        if entry is not None:
+            alive = not self.pre_ping or self._ping(entry.connection)
+            with self.condition:
+                if alive:
+                    self.counters['reused'] += 1
+                    return entry.connection
+                self.checked_out.pop(id(entry.connection), None)
+                self._discard(entry.connection, 'failover')
+                self._flush()
+                self.opening += 1
+
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.opening -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.opening -= 1
+            self.counters['created'] += 1
+            self.checked_out[id(connection)] = PooledConnection(connection, time.monotonic(), self.generation, None)
+        return connection
+
+    def release(self, connection, reset=False):
+        """Give a connection back, rolled back and reusable, or close it."""
+        status = connection.get_transaction_status() if not connection.closed else extensions.TRANSACTION_STATUS_UNKNOWN
+        broken = status == extensions.TRANSACTION_STATUS_UNKNOWN
+        if not broken and (status != extensions.TRANSACTION_STATUS_IDLE or reset):
+            try:
+                if status != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+                if reset:
+                    # server-side cursors declared WITH HOLD outlive the transaction
+                    with connection.cursor() as cursor:
+                        cursor.execute('CLOSE ALL')
+            except psycopg2.Error:
+                broken = True
+
+        with self.condition:
+            self._check_pid()
+            entry = self.checked_out.pop(id(connection), None)
+            now = time.monotonic()
+            if broken:
+                self._discard(connection, 'failover')
+                self._flush()
+            elif entry is None:
+                # opened before a fork or a pool reset
+                self._discard(connection, 'orphan')
+            else:
+                entry = entry._replace(released=now)
+                reason = self._is_expired(entry, now)
+                if reason:
+                    self._discard(connection, reason)
+                else:
+                    self.idle.append(entry)
+            self.condition.notify()
+
+    def discard(self, connection):
+        with self.condition:
+            self.checked_out.pop(id(connection), None)
+            self._discard(connection, 'closed')
+            self.condition.notify()
+
+    def _flush(self):
+        self.counters['failovers'] += 1
+        self.generation += 1
+        for entry in self.idle:
+            self._discard(entry.connection, 'failover')
+        self.idle = []
+
+    def flush(self):
+        """Drop every idle connection, e.g. after a planned switchover."""
+        with self.condition:
+            self._flush()
+
+    def stats(self):
+        with self.condition:
+            data = {
+                'max_size': self.max_size,
+                'in_use': len(self.checked_out) + self.opening,
+                'idle': len(self.idle),
+                'generation': self.generation,
+            }
+            data.update(self.counters)
+        return data
+
+
+def get_pool(alias, options):
+    pool = _pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                pool = _pools[alias] = ConnectionPool(
+                    alias,
+                    max_size=options.get('MAX_SIZE', 10),
+                    idle_timeout=options.get('IDLE_TIMEOUT', 300),
+                    max_lifetime=options.get('MAX_LIFETIME', 3600),
+                    pre_ping=options.get('PRE_PING', True),
+                    timeout=options.get('TIMEOUT', 10),
+                )
+    return pool
+
+
+def get_pool_stats():
+    return {alias: pool.stats() for alias, pool in list(_pools.items())}
@@ -0,0 +1,115 @@
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY = DEFAULT_DB_ALIAS
+
+_routing = contextvars.ContextVar('db_routing', default=None)
+
+
+class RoutingState(object):
+    """Database choice of one request, see ReplicaRoutingMiddleware."""
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        # set by the first write, the rest of the request reads the primary
+        self.wrote = False
+        self._replica = None
+
+    @property
+    def replica(self):
+        if self._replica is None:
+            self._replica = random.choice(settings.DATABASE_REPLICAS)
+        return self._replica
+
+
+def get_state():
+    return _routing.get()
+
+
+def set_state(state):
+    return _routing.set(state)
+
+
+def reset_state(token):
+    _routing.reset(token)
+
+
+@contextmanager
+def read_primary():
+    """Send the reads of the block to the primary, even in a safe-method request."""
+    state = _routing.get()
+    if state is None or not state.use_replica:
+        yield
+        return
+    state.use_replica = False
+    try:
+        yield
+    finally:
+        state.use_replica = True
+
+
+def iterate_with_state(state, iterable):
+    """
+    Run a streaming response body with the request routing state, it is
+    consumed after the middleware has returned.
+    """
+    iterator = iter(iterable)
+    while True:
+        token = _routing.set(state)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _routing.reset(token)
+        yield chunk
+
+
+def _recent_write_key(client):
+    return 'db:recent-write:%s' % client
+
+
+def has_recent_write(client):
+    return bool(settings.DATABASE_REPLICAS) and cache.get(_recent_write_key(client)) is not None
+
+
+def mark_recent_write(client):
+    """Keep the client on the primary until the replicas have caught up."""
+    if settings.DATABASE_REPLICAS:
+        cache.set(_recent_write_key(client), 1, settings.DATABASE_REPLICA_LAG_WINDOW)
+
+
+class ReplicaRouter(object):
+    """
+    Send reads of safe-method requests to a replica picked once per request.
+    Everything else, writes, reads after a write and reads inside a
+    transaction on the primary, goes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.use_replica or state.wrote or not settings.DATABASE_REPLICAS:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY}.union(settings.DATABASE_REPLICAS)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -0,0 +1,35 @@
+class EagerLoadingSerializerMixin(object):
+    """
+    Let a serializer declare the relations it reads, so list views can
+    load them together with the page instead of once per row.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    # columns the serializer never reads
+    defer_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.defer_fields:
+            queryset = queryset.defer(*cls.defer_fields)
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+
+class EagerLoadingViewMixin(object):
+    """
+    Apply the eager loading declared on the view serializer to every
+    queryset the view builds.
+    """
+
+    def eager_load(self, queryset):
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+    def get_queryset(self):
+        return self.eager_load(super(EagerLoadingViewMixin, self).get_queryset())
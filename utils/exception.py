@@ -73,3 +73,14 @@ class PermissionDenied(APIException):
     status_code = 400
     default_detail = 'You do not have permission to perform this action'
     default_code = 'permission_denied'
+
+
+class ServiceUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Service temporarily unavailable, try again later'
+    default_code = 'service_unavailable'
+
+    def __init__(self, detail=None, code=None, wait=None):
+        super(ServiceUnavailable, self).__init__(detail, code)
+        # sent as Retry-After by the DRF exception handler
+        self.wait = wait
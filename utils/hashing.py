@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from utils import exception, metrics
+
+
+class HasherPool(object):
+    """
+    Password hashing off the request threads, on PASSWORD_HASHER_WORKERS
+    threads of their own (PBKDF2 releases the GIL). At most
+    PASSWORD_HASHER_QUEUE jobs wait for a thread, any more are refused at
+    once with a 503 instead of piling up behind a login burst and holding
+    every worker.
+    """
+
+    def __init__(self, workers, queue):
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(workers + queue)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hasher')
+        self.pid = os.getpid()
+
+    def submit(self, operation, func, *args):
+        if not self.slots.acquire(blocking=False):
+            metrics.PASSWORD_HASH_SHED.inc((operation,))
+            raise exception.ServiceUnavailable(wait=settings.PASSWORD_HASHER_RETRY_AFTER)
+        queued = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            metrics.PASSWORD_HASH_WAIT.observe((operation,), started - queued)
+            try:
+                return func(*args)
+            finally:
+                metrics.PASSWORD_HASH_TIME.observe((operation,), time.perf_counter() - started)
+
+        try:
+            future = self.executor.submit(job)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda done: self.slots.release())
+        return future
+
+    def run(self, operation, func, *args):
+        future = self.submit(operation, func, *args)
+        try:
+            return future.result(timeout=settings.PASSWORD_HASHER_TIMEOUT)
+        except TimeoutError:
+            # the job still holds its slot until it runs, nothing else is queued behind it
+            future.cancel()
+            metrics.PASSWORD_HASH_SHED.inc((operation,))
+            raise exception.ServiceUnavailable(wait=settings.PASSWORD_HASHER_RETRY_AFTER)
+
+
+_pool = None
+_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _lock:
+        # threads do not survive a fork, a forked worker starts its own pool
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = HasherPool(settings.PASSWORD_HASHER_WORKERS, settings.PASSWORD_HASHER_QUEUE)
+        return _pool
+
+
+def make_password(password, salt=None):
+    """django.contrib.auth.hashers.make_password on the hasher pool."""
+    return get_pool().run('hash', hashers.make_password, password, salt)
+
+
+def _verify(password, encoded):
+    """Check a password, and hash it again when the preferred hasher or its parameters changed."""
+    outdated = []
+    valid = hashers.check_password(password, encoded, setter=outdated.append)
+    return valid, hashers.make_password(password) if outdated else None
+
+
+def check_password(user, password):
+    """
+    user.check_password on the hasher pool. A password hashed with an
+    outdated hasher or work factor is upgraded on success, like Django
+    does, with a conditional update rather than user.save(): the encoding
+    changes, not the password, so tokens are not revoked.
+    """
+    encoded = user.password
+    valid, rehashed = get_pool().run('verify', _verify, password, encoded)
+    if rehashed is not None:
+        user.__class__._default_manager.filter(pk=user.pk, password=encoded).update(password=rehashed)
+    return valid
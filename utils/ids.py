@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+# unix time in ms and rand_a counter of the last uuid7() of this process
+_last = {'milliseconds': 0, 'counter': 0}
+
+
+def build_uuid7(milliseconds, random_bits):
+    """
+    UUID version 7 (RFC 9562): a 48 bit unix timestamp in ms followed by
+    74 bits taken from random_bits, 12 in rand_a and 62 in rand_b.
+    """
+    rand_a = (random_bits >> 62) & 0xfff
+    rand_b = random_bits & ((1 << 62) - 1)
+    return uuid.UUID(int=(milliseconds & 0xffffffffffff) << 80 | 0x7 << 76 | rand_a << 64 | 0x2 << 62 | rand_b)
+
+
+def uuid7():
+    """
+    Time-ordered replacement for uuid.uuid4() as a key default: values
+    created later sort after earlier ones, so inserts land at the right
+    edge of the index instead of anywhere in it. Monotonic within the
+    process, rand_a counts up when several are created in the same ms.
+    """
+    milliseconds = time.time_ns() // 1000000
+    random_bits = int.from_bytes(os.urandom(10), 'big')
+    with _lock:
+        if milliseconds > _last['milliseconds']:
+            # start low in the counter space so there is room to count up
+            counter = (random_bits >> 62) & 0x7ff
+        else:
+            milliseconds = _last['milliseconds']
+            counter = _last['counter'] + 1
+            if counter > 0xfff:
+                milliseconds, counter = milliseconds + 1, 0
+        _last['milliseconds'], _last['counter'] = milliseconds, counter
+    return build_uuid7(milliseconds, counter << 62 | random_bits & ((1 << 62) - 1))
+
+
+def uuid7_time(value):
+    """Unix time in seconds of a version 7 UUID."""
+    return (value.int >> 80) / 1000.0
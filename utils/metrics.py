@@ -0,0 +1,243 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from utils.db.pool import get_pool_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics(object):
+    """Database and serializer work of the request being handled."""
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+def current():
+    return _current.get()
+
+
+def start_request(request):
+    metrics = RequestMetrics(request)
+    return metrics, _current.set(metrics)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def record_query(duration):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.queries += 1
+        metrics.query_time += duration
+
+
+def query_timer(execute, sql, params, many, context):
+    """Execute wrapper timing every statement of the current request."""
+    if _current.get() is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record_query(time.perf_counter() - started)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver, pooled connections are created more than once."""
+    if query_timer not in connection.execute_wrappers:
+        # at the front: an execute_wrapper() block opened before the connect
+        # pops the last wrapper when it exits
+        connection.execute_wrappers.insert(0, query_timer)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield '%s%s %s' % (self.name, _format_labels(self.labels, labels), value)
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket, +Inf included], sum
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(labels) or ([0] * (len(self.buckets) + 1), 0)
+            counts[index] += 1
+            self.values[labels] = (counts, total + value)
+
+    def samples(self):
+        with self.lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self.values.items()}
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield '%s_bucket%s %s' % (self.name, _format_labels(self.labels, labels, [('le', bound)]),
+                                          cumulative)
+            yield '%s_sum%s %s' % (self.name, _format_labels(self.labels, labels), total)
+            yield '%s_count%s %s' % (self.name, _format_labels(self.labels, labels), cumulative)
+
+
+REQUESTS = Counter('http_requests_total', 'Requests by route, method and status.',
+                   ('route', 'method', 'status'))
+LATENCY = Histogram('http_request_duration_seconds', 'Time to build the response, streamed bodies excluded.',
+                    ('route', 'method'), LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size.', ('route',), SIZE_BUCKETS)
+DB_QUERIES = Histogram('db_queries_per_request', 'Database statements run per request.',
+                       ('route',), QUERY_BUCKETS)
+DB_TIME = Histogram('db_query_duration_seconds', 'Database time per request.', ('route',), LATENCY_BUCKETS)
+SERIALIZER_TIME = Histogram('serializer_duration_seconds', 'Serializer to_representation time per request.',
+                            ('route',), LATENCY_BUCKETS)
+
+PASSWORD_HASH_TIME = Histogram('password_hash_duration_seconds', 'Time spent hashing or verifying a password.',
+                               ('operation',), LATENCY_BUCKETS)
+PASSWORD_HASH_WAIT = Histogram('password_hash_wait_seconds', 'Time a password job waited for a hasher thread.',
+                               ('operation',), LATENCY_BUCKETS)
+PASSWORD_HASH_SHED = Counter('password_hash_shed_total', 'Password jobs refused with a 503, the hasher pool was full.',
+                             ('operation',))
+THROTTLED = Counter('http_requests_throttled_total', 'Requests refused with a 429 by a token bucket.',
+                    ('scope', 'bucket'))
+BLOOM_CHECKS = Counter('membership_filter_checks_total',
+                       'Existence checks by bloom filter answer: miss (no query), hit, false_positive, unavailable.',
+                       ('filter', 'result'))
+
+METRICS = (REQUESTS, LATENCY, RESPONSE_SIZE, DB_QUERIES, DB_TIME, SERIALIZER_TIME,
+           PASSWORD_HASH_TIME, PASSWORD_HASH_WAIT, PASSWORD_HASH_SHED, THROTTLED, BLOOM_CHECKS)
+
+
+def get_route(request):
+    """The url pattern of the request, not its path, to keep label values bounded."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return getattr(match, 'route', None) or match.view_name
+
+
+def observe_request(request, response, metrics, duration):
+    route = get_route(request)
+    REQUESTS.inc((route, request.method, response.status_code))
+    LATENCY.observe((route, request.method), duration)
+    DB_QUERIES.observe((route,), metrics.queries)
+    DB_TIME.observe((route,), metrics.query_time)
+    SERIALIZER_TIME.observe((route,), metrics.serializer_time)
+    if response.streaming:
+        response.streaming_content = _count_streamed(route, response.streaming_content)
+    else:
+        RESPONSE_SIZE.observe((route,), len(response.content))
+
+
+def _count_streamed(route, chunks):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    RESPONSE_SIZE.observe((route,), size)
+
+
+def render_pool_stats():
+    pools = sorted(get_pool_stats().items())
+    lines = []
+    if not pools:
+        return lines
+    for name, key, kind in (('db_pool_connections_in_use', 'in_use', 'gauge'),
+                            ('db_pool_connections_idle', 'idle', 'gauge'),
+                            ('db_pool_connections_created_total', 'created', 'counter'),
+                            ('db_pool_connections_reused_total', 'reused', 'counter'),
+                            ('db_pool_waits_total', 'waits', 'counter'),
+                            ('db_pool_timeouts_total', 'timeouts', 'counter'),
+                            ('db_pool_failovers_total', 'failovers', 'counter')):
+        lines.append('# TYPE %s %s' % (name, kind))
+        for alias, stats in pools:
+            lines.append('%s%s %s' % (name, _format_labels(('alias',), (alias,)), stats.get(key, 0)))
+    return lines
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+        lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+        lines.extend(metric.samples())
+    lines.extend(render_pool_stats())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of this process. Protected by a bearer
+    token when METRICS_TOKEN is set.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.META.get('HTTP_AUTHORIZATION') != 'Bearer %s' % token:
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class TimedSerializerMixin(object):
+    """
+    Add the to_representation time of the serializer to the request
+    metrics. Nested timed serializers are counted once, in the outermost.
+    """
+
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None or metrics.serializer_depth:
+            return super(TimedSerializerMixin, self).to_representation(instance)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super(TimedSerializerMixin, self).to_representation(instance)
+        finally:
+            metrics.serializer_depth -= 1
+            metrics.serializer_time += time.perf_counter() - started
@@ -1,17 +1,26 @@
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
 from rest_framework import pagination
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, InvalidPage, Page, PageNotAnInteger, Paginator
+from django.utils.functional import cached_property
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+import base64
+import binascii
+import datetime
+import json
+import functools
 import math
 
+from utils.counting import ExactCount, KnownCount
+from utils.db.aio import get_database
+
 DEFAULT_PAGE = 1
 DEFAULT_PAGE_SIZE = 10
 
-class LargeResultsSetPagination(PageNumberPagination):
-    page_size = 1000
-    page_size_query_param = 'page_size'
-    max_page_size = 10000
-
-
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page'
@@ -29,26 +38,119 @@ class CustomPagination(PageNumberPagination):
             'results': data
         })
 
+class CountingPaginator(Paginator):
+    """
+    Paginator taking its count from a count strategy (utils.counting).
+    With an approximate count, pages past the estimate are still served
+    and no page is trimmed to it.
+    """
+
+    def __init__(self, object_list, per_page, counter=None, **kwargs):
+        super(CountingPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.counter = counter or ExactCount()
+        self.count_is_approximate = False
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return len(self.object_list)
+        value, self.count_is_approximate = self.counter.count(self.object_list)
+        return value
+
+    def validate_number(self, number):
+        # count_is_approximate is only known once the count has run
+        if self.count is not None and not self.count_is_approximate:
+            return super(CountingPaginator, self).validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_approximate:
+            return super(CountingPaginator, self).page(number)
+        bottom = (number - 1) * self.per_page
+        return Page(self.object_list[bottom:bottom + self.per_page], number, self)
+
+
 class PageNumberPagination(pagination.PageNumberPagination):
+    """
+    Views choose how the total is counted with a `count_strategy`
+    attribute (utils.counting.ExactCount, CachedCount or EstimatedCount).
+    """
     page_size = 10
     page_size_query_param = 'limit'
 
-    def get_paginated_response(self, data):
+    def paginate_queryset(self, queryset, request, view=None):
+        self.counter = getattr(view, 'count_strategy', None)
+        return super(PageNumberPagination, self).paginate_queryset(queryset, request, view)
+
+    @property
+    def django_paginator_class(self):
+        return functools.partial(CountingPaginator, counter=getattr(self, 'counter', None))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, count and page run on utils.db.aio."""
+        database = get_database(queryset.db)
+        counter = getattr(view, 'count_strategy', None) or ExactCount()
+        value, approximate = await counter.acount(queryset, database)
+        page = self.paginate_queryset_lazy(queryset, request, view, counter=KnownCount(value, approximate))
+        if page is None:
+            return None
+        return await database.fetch(page)
+
+    def paginate_queryset_lazy(self, queryset, request, view=None, counter=None):
+        """
+        Same as paginate_queryset, but return the page as an unevaluated
+        queryset slice, for apaginate_queryset to run on utils.db.aio.
+        """
+        self.counter = counter or getattr(view, 'count_strategy', None)
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+        self.request = request
+        return self.page.object_list
+
+    def get_paging(self):
         per_page = self.page.paginator.per_page
         count = self.page.paginator.count
         total_page = math.ceil(count / per_page)
+        return {
+            'prev': self.get_previous_link(),
+            'next': self.get_next_link(),
+            'page': self.page.number,
+            'page_size': per_page,
+            'total_record': count,
+            'total_page': total_page,
+            'count_is_approximate': self.page.paginator.count_is_approximate,
+        }
+
+    def get_paginated_response(self, data):
         return Response({
-            'links': {
-                'prev': self.get_previous_link(),
-                'next': self.get_next_link(),
-                'page': self.page.number,
-                'page_size': per_page,
-                'total_record': count,
-                'total_page': total_page,
-            },
+            'links': self.get_paging(),
             'data': data
         })
 
+
+class LargeResultsSetPagination(PageNumberPagination):
+    page_size = 1000
+    page_size_query_param = 'page_size'
+    max_page_size = 10000
+
 class CustomPagination2(PageNumberPagination):
     page = DEFAULT_PAGE
     page_size = DEFAULT_PAGE_SIZE
@@ -65,3 +167,195 @@ class CustomPagination2(PageNumberPagination):
             'page_size': int(self.request.GET.get('page_size', self.page_size)),
             'results': data
         })
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder keeping microseconds, cursors compare on the exact value."""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super(CursorJSONEncoder, self).default(o)
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Cursor pagination on (ordering key, id).
+
+    Pages are fetched with a WHERE on the last seen (key, id) pair instead
+    of OFFSET, and no COUNT(*) is run, so every page costs the same. The
+    ordering key comes from the OrderingFilter of the view when there is
+    one, so ?ordering= keeps working; the id tie-breaker keeps the order
+    total. Null keys follow the Postgres default (last ascending, first
+    descending).
+    """
+    cursor_query_param = 'cursor'
+    page_size = 10
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page(await get_database(page_queryset.db).fetch(page_queryset))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """The ordered, filtered slice holding the page plus one look-ahead row."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.key, self.descending = self.get_key(request, queryset, view)
+        self.field = self.get_key_field(queryset.model)
+
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor['reverse'])
+        descending = self.descending != self.reverse
+        queryset = queryset.order_by(*self.get_order_by(descending))
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_position_filter(
+                self.cursor['value'], self.cursor['id'], descending))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            return pagination._positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_key(self, request, queryset, view):
+        ordering = None
+        for filter_cls in getattr(view, 'filter_backends', []):
+            if hasattr(filter_cls, 'get_ordering'):
+                ordering = filter_cls().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            ordering = queryset.query.order_by or queryset.model._meta.ordering or ('id',)
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+
+        key = ordering[0]
+        descending = key.startswith('-')
+        key = key.lstrip('-')
+        if key == 'pk' or '__' in key:
+            key = 'id'
+        return key, descending
+
+    def get_key_field(self, model):
+        if self.key == 'id':
+            return None
+        try:
+            return model._meta.get_field(self.key)
+        except FieldDoesNotExist:
+            # annotation, e.g. a search rank
+            return None
+
+    def get_order_by(self, descending):
+        prefix = '-' if descending else ''
+        if self.key == 'id':
+            return [prefix + 'id']
+        return [prefix + self.key, prefix + 'id']
+
+    def get_position_filter(self, value, pk, descending):
+        key = self.key
+        if key == 'id':
+            return Q(id__lt=pk) if descending else Q(id__gt=pk)
+        if descending:
+            if value is None:
+                return Q(**{key + '__isnull': True, 'id__lt': pk}) | Q(**{key + '__isnull': False})
+            return Q(**{key + '__lt': value}) | Q(**{key: value, 'id__lt': pk})
+        if value is None:
+            return Q(**{key + '__isnull': True, 'id__gt': pk})
+        return Q(**{key + '__gt': value}) | Q(**{key: value, 'id__gt': pk}) | Q(**{key + '__isnull': True})
+
+    def get_position(self, instance):
+        if self.key == 'id':
+            return None, instance.id
+        attname = self.field.attname if self.field is not None else self.key
+        return getattr(instance, attname), instance.id
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            value, pk, reverse = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            if self.field is not None and value is not None:
+                value = self.field.to_python(value)
+            return {'value': value, 'id': int(pk), 'reverse': bool(reverse)}
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        value, pk = self.get_position(instance)
+        payload = json.dumps([value, pk, int(reverse)], cls=CursorJSONEncoder, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return replace_query_param(self.base_url, self.cursor_query_param, '')
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'links': {
+                'prev': self.get_previous_link(),
+                'next': self.get_next_link(),
+                'cursor': self.request.query_params.get(self.cursor_query_param) or None,
+                'page_size': self.page_size,
+            },
+            'data': data
+        })
+
+
+class CatalogPagination(PageNumberPagination):
+    """
+    Page numbers by default, keyset pagination when the request carries a
+    ?cursor= parameter (empty for the first page).
+    """
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super(CatalogPagination, self).paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+        return await super(CatalogPagination, self).apaginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super(CatalogPagination, self).get_paginated_response(data)
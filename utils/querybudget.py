@@ -0,0 +1,112 @@
+import contextvars
+import logging
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter(object):
+    """Database execute wrapper counting the statements run through it."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the queries run on every configured connection, without
+    relying on DEBUG and connection.queries.
+    """
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+# counter of the async request being served, see count_async_queries
+_async_counter = contextvars.ContextVar('query_budget_async_counter', default=None)
+
+
+@contextmanager
+def count_async_queries():
+    """
+    count_queries for async views: utils.db.aio statements do not go
+    through Django's connections, they report to record_async_query.
+    """
+    counter = QueryCounter()
+    token = _async_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _async_counter.reset(token)
+
+
+def record_async_query():
+    counter = _async_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+
+class QueryBudgetMixin(object):
+    """
+    Enforce a fixed number of queries per request on a view.
+
+    query_budget is the maximum number of queries the whole request may
+    run (authentication included, and the queries of a streamed body while
+    it is written out). Going over raises QueryBudgetExceeded when
+    QUERY_BUDGET_RAISE is on (the default under DEBUG), otherwise the
+    overrun is logged.
+    """
+    query_budget = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.query_budget is None:
+            return super(QueryBudgetMixin, self).dispatch(request, *args, **kwargs)
+
+        with count_queries() as counter:
+            response = super(QueryBudgetMixin, self).dispatch(request, *args, **kwargs)
+
+        if getattr(response, 'streaming', False):
+            response.streaming_content = self.count_stream(response.streaming_content, counter.count)
+        else:
+            self.check_budget(counter.count)
+        return response
+
+    def count_stream(self, chunks, spent):
+        """Keep counting while the body streams, so an N+1 per row still shows."""
+        iterator = iter(chunks)
+        checked = False
+        while True:
+            with count_queries() as counter:
+                # chunks are bytes, None marks the end
+                chunk = next(iterator, None)
+            spent += counter.count
+            if chunk is None:
+                break
+            if not checked and spent > self.query_budget:
+                checked = True
+                self.check_budget(spent)
+            yield chunk
+        if not checked:
+            self.check_budget(spent)
+
+    def check_budget(self, count):
+        if count <= self.query_budget:
+            return
+        message = '%s ran %s queries, budget is %s' % (self.__class__.__name__, count, self.query_budget)
+        if getattr(settings, 'QUERY_BUDGET_RAISE', settings.DEBUG):
+            raise QueryBudgetExceeded(message)
+        logger.error(message)
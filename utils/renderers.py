@@ -1,22 +1,133 @@
+import datetime
+import decimal
+import json
+
+from django.conf import settings
+from django.db.models.query import QuerySet
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
 from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def envelope(data):
+    if data and 'error' in data and data['error']:
+        return {'status': data['status'],
+                'body': data['body'],
+                'error': data['error']
+                }
+    elif data and 'links' in data and data['links']:
+        return {
+            'status': 'OK',
+            'body': data['data'],
+            'error': None,
+            'paging': data['links']
+        }
+    return {'status': 'OK',
+            'body': data,
+            'error': None}
+
+
+# formats datetime, date and time for orjson_default
+DATETIME_ENCODER = JSONEncoder()
+
+
+def orjson_default(obj):
+    """
+    Types orjson does not encode itself, converted the way DRF's
+    JSONEncoder does. UUID is native; datetime, date and time are passed
+    through to the encoder so their precision and offset format do not
+    change with the backend.
+    """
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return DATETIME_ENCODER.default(obj)
+    elif isinstance(obj, Promise):
+        return force_str(obj)
+    elif isinstance(obj, decimal.Decimal):
+        return float(obj)
+    elif isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    elif isinstance(obj, QuerySet):
+        return tuple(obj)
+    elif isinstance(obj, bytes):
+        return obj.decode()
+    elif hasattr(obj, 'tolist'):
+        return obj.tolist()
+    elif hasattr(obj, '__getitem__'):
+        cls = (list if isinstance(obj, (list, tuple)) else dict)
+        try:
+            return cls(obj)
+        except Exception:
+            pass
+    elif hasattr(obj, '__iter__'):
+        return tuple(item for item in obj)
+    raise TypeError('Object of type %s is not JSON serializable' % type(obj).__name__)
 
 
 class EmberJSONRenderer(JSONRenderer):
+    # bytes per chunk written by render_stream
+    stream_chunk_size = 64 * 1024
+    # 'orjson' or 'json', defaults to settings.JSON_RENDERER_BACKEND
+    backend = None
+
+    def get_backend(self):
+        backend = self.backend or getattr(settings, 'JSON_RENDERER_BACKEND', 'orjson')
+        # orjson cannot escape non-ASCII (UNICODE_JSON = False)
+        if backend == 'orjson' and (orjson is None or self.ensure_ascii):
+            return 'json'
+        return backend
+
     def render(self, data, accepted_media_type=None, renderer_context=None):
-        if data and 'error' in data and data['error']:
-            data = {'status': data['status'],
-                    'body': data['body'],
-                    'error': data['error']
-                    }
-        elif data and 'links' in data and data['links']:
-            data = {
-                'status': 'OK',
-                'body': data['data'],
-                'error': None,
-                'paging': data['links']
-            }
-        else:
-            data = {'status': 'OK',
-                    'body': data,
-                    'error': None}
-        return super(EmberJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        data = envelope(data)
+        # orjson only writes compact output, indented responses stay on DRF
+        if self.get_backend() == 'json' or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super(EmberJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        return self.dumps(data)
+
+    def dumps(self, data):
+        """
+        Compact UTF-8 JSON bytes that decode to the same value as DRF's
+        JSONRenderer output. The bytes can differ for floats, orjson
+        writes 1e16 and 0.00001 where json writes 1e+16 and 1e-05, and
+        NaN / Infinity become null instead of raising.
+        """
+        if self.get_backend() == 'orjson':
+            try:
+                ret = orjson.dumps(data, default=orjson_default,
+                                   option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+            except TypeError:
+                # e.g. integers wider than 64 bit, let the stdlib encoder try
+                pass
+            else:
+                return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+        ret = json.dumps(
+            data, cls=self.encoder_class,
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict, separators=(',', ':')
+        )
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
+
+    def render_stream(self, rows):
+        """
+        Yield the {status, body, error} envelope around an iterable
+        of already serialized rows, in chunks of about stream_chunk_size
+        bytes, so memory does not grow with the number of rows.
+        """
+        chunk = [b'{"status":"OK","body":[']
+        size = 0
+        for index, row in enumerate(rows):
+            item = self.dumps(row)
+            chunk.append(b',' + item if index else item)
+            size += len(item)
+            if size >= self.stream_chunk_size:
+                yield b''.join(chunk)
+                chunk, size = [], 0
+        chunk.append(b'],"error":null}')
+        yield b''.join(chunk)
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import traceback
+
+import psycopg2
+from django.conf import settings
+
+from utils import metrics
+
+STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+NUMBER_PATTERN = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_PATTERN = re.compile(r'%s|\$\d+')
+LIST_PATTERN = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+SPACE_PATTERN = re.compile(r'\s+')
+
+# frames of these files are skipped when looking for the caller
+SKIPPED_FILES = (os.sep + 'site-packages' + os.sep, os.path.join('utils', 'slowqueries.py'),
+                 os.path.join('utils', 'metrics.py'), os.path.join('utils', 'db', ''))
+
+
+def fingerprint(sql):
+    """SQL with literals and parameters replaced by ?, IN lists folded, and its short hash."""
+    normalized = STRING_PATTERN.sub('?', sql)
+    normalized = PLACEHOLDER_PATTERN.sub('?', normalized)
+    normalized = NUMBER_PATTERN.sub('?', normalized)
+    normalized = LIST_PATTERN.sub('(...)', normalized)
+    normalized = SPACE_PATTERN.sub(' ', normalized).strip()
+    return normalized, hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def get_location():
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(base_dir) and not any(part in frame.filename for part in SKIPPED_FILES):
+            return '%s:%s in %s' % (os.path.relpath(frame.filename, base_dir), frame.lineno, frame.name)
+    return None
+
+
+def get_view():
+    request_metrics = metrics.current()
+    match = getattr(getattr(request_metrics, 'request', None), 'resolver_match', None)
+    return match._func_path if match is not None else None
+
+
+def format_params(params):
+    if params is None:
+        return None
+    values = list(params.values() if isinstance(params, dict) else params)
+    return [repr(value)[:200] for value in values[:20]]
+
+
+def explain(raw_connection, sql, params):
+    """
+    Plan of a SELECT, run on the psycopg2 connection to bypass the execute
+    wrappers. Inside a transaction a savepoint keeps a failing EXPLAIN
+    from aborting it.
+    """
+    in_transaction = not raw_connection.autocommit
+    with raw_connection.cursor() as cursor:
+        if in_transaction:
+            cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            cursor.execute('EXPLAIN (ANALYZE off) ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        except psycopg2.Error as error:
+            if in_transaction:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            return 'EXPLAIN failed: %s' % error
+        if in_transaction:
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+
+
+class SlowQueryStore(object):
+    """
+    Statements slower than SLOW_QUERY_THRESHOLD_MS, aggregated by
+    fingerprint. Holds at most SLOW_QUERY_MAX_FINGERPRINTS entries, the
+    one with the least total time makes room for a new fingerprint.
+    Plans are refreshed after SLOW_QUERY_EXPLAIN_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def needs_plan(self, key):
+        entry = self.entries.get(key)
+        return entry is None or time.time() - entry['explained_at'] > settings.SLOW_QUERY_EXPLAIN_INTERVAL
+
+    def add(self, sql, params, duration, plan=None):
+        normalized, key = fingerprint(sql)
+        now = time.time()
+        view = get_view()
+        location = get_location()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if len(self.entries) >= settings.SLOW_QUERY_MAX_FINGERPRINTS:
+                    smallest = min(self.entries, key=lambda name: self.entries[name]['total_time'])
+                    del self.entries[smallest]
+                entry = self.entries[key] = {
+                    'fingerprint': key, 'query': normalized, 'count': 0, 'total_time': 0.0, 'max_time': 0.0,
+                    'views': [], 'plan': None, 'explained_at': 0,
+                }
+            entry['count'] += 1
+            entry['total_time'] += duration
+            if duration >= entry['max_time']:
+                entry['max_time'] = duration
+                entry['sql'] = sql[:4000]
+                entry['params'] = format_params(params)
+                entry['location'] = location
+            if view and view not in entry['views'] and len(entry['views']) < 10:
+                entry['views'].append(view)
+            entry['last_seen'] = now
+            if plan is not None:
+                entry['plan'], entry['explained_at'] = plan, now
+        return key
+
+    def top(self, limit):
+        with self.lock:
+            entries = [dict(entry) for entry in self.entries.values()]
+        entries.sort(key=lambda entry: entry['total_time'], reverse=True)
+        return entries[:limit]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+store = SlowQueryStore()
+
+
+def get_threshold():
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+    return threshold / 1000.0 if threshold is not None else None
+
+
+def record(sql, params, duration, raw_connection=None):
+    threshold = get_threshold()
+    if threshold is None or duration < threshold:
+        return
+    plan = None
+    is_select = sql.lstrip()[:6].upper() == 'SELECT'
+    if raw_connection is not None and is_select and store.needs_plan(fingerprint(sql)[1]):
+        plan = explain(raw_connection, sql, params)
+    store.add(sql, params, duration, plan)
+
+
+def slow_query_recorder(execute, sql, params, many, context):
+    """Execute wrapper feeding the slow query store."""
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    if not many:
+        record(sql, params, time.perf_counter() - started, context['connection'].connection)
+    return result
+
+
+def install_recorder(sender, connection, **kwargs):
+    """connection_created receiver, see metrics.install_query_timer."""
+    if get_threshold() is not None and slow_query_recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_recorder)
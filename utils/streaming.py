@@ -0,0 +1,23 @@
+from django.http import StreamingHttpResponse
+
+from utils.renderers import EmberJSONRenderer
+
+
+class StreamingListMixin(object):
+    """
+    Stream a list response instead of building it in memory: rows come
+    from a server-side cursor (QuerySet.iterator), are serialized one at a
+    time and written out in chunks inside the usual envelope.
+
+    The serializer is instantiated once and reused for every row; only
+    select_related eager loading applies, iterator() skips prefetches.
+    """
+    # rows fetched per round trip of the server-side cursor
+    stream_fetch_size = 2000
+
+    def stream_list(self, queryset):
+        serializer = self.get_serializer()
+        rows = (serializer.to_representation(instance)
+                for instance in queryset.iterator(chunk_size=self.stream_fetch_size))
+        renderer = EmberJSONRenderer()
+        return StreamingHttpResponse(renderer.render_stream(rows), content_type=renderer.media_type)
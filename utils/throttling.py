@@ -0,0 +1,209 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'<requests>/<period>', as in DEFAULT_THROTTLE_RATES, to (capacity, tokens per second)."""
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / DURATIONS[period[0]]
+
+
+def take_token(tokens, stamp, now, capacity, refill):
+    """
+    One step of a token bucket: refill for the time elapsed since stamp,
+    then take a token. Returns (allowed, tokens left, seconds until the
+    next token when refused).
+    """
+    tokens = min(capacity, tokens + max(0.0, now - stamp) * refill)
+    if tokens >= 1:
+        return True, tokens - 1, 0
+    return False, tokens, (1 - tokens) / refill
+
+
+class LocalBuckets(object):
+    """
+    Buckets in process memory, an LRU of at most THROTTLE_LOCAL_MAX_KEYS.
+    Every worker process counts on its own, so the effective limit is the
+    rate times the number of workers.
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, refill):
+        now = time.monotonic()
+        with self.lock:
+            tokens, stamp = self.buckets.pop(key, (capacity, now))
+            allowed, tokens, wait = take_token(tokens, stamp, now, capacity, refill)
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return allowed, wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+# KEYS[1] bucket; ARGV capacity, tokens per ms, now in ms, ttl in ms.
+# Returns {allowed, ms until the next token}, Redis truncates Lua numbers
+TAKE_TOKEN_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(state[1]) or capacity
+local stamp = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - stamp) * refill)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'stamp', math.max(now, stamp))
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+if allowed == 1 then
+    return {1, 0}
+end
+return {0, math.ceil((1 - tokens) / refill)}
+"""
+
+
+class RedisBuckets(object):
+    """
+    Buckets shared by every process, one hash per key updated by a Lua
+    script, so a check is a single round trip. The hash expires once the
+    bucket would be full again. When Redis fails the request is checked
+    against the local buckets instead of being refused; the failure and
+    the recovery are logged once each, not on every request.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.script = None
+        self.failing = False
+
+    def get_script(self):
+        if self.script is None:
+            # django_redis is only installed where REDIS_URL is used
+            from django_redis import get_redis_connection
+
+            self.script = get_redis_connection('default').register_script(TAKE_TOKEN_SCRIPT)
+        return self.script
+
+    def take(self, key, capacity, refill):
+        refill_ms = refill / 1000
+        ttl = int(math.ceil(capacity / refill_ms))
+        try:
+            allowed, wait = self.get_script()(keys=[key], args=[capacity, refill_ms, int(time.time() * 1000), ttl])
+        except Exception:
+            if not self.failing:
+                self.failing = True
+                logger.warning('Redis throttle failed, using the local buckets until it recovers', exc_info=True)
+            return self.fallback.take(key, capacity, refill)
+        if self.failing:
+            self.failing = False
+            logger.warning('Redis throttle recovered')
+        return bool(allowed), wait / 1000
+
+
+_lock = threading.Lock()
+_backends = {}
+
+
+def get_backend(name):
+    with _lock:
+        if not _backends:
+            _backends['local'] = LocalBuckets(settings.THROTTLE_LOCAL_MAX_KEYS)
+            _backends['redis'] = RedisBuckets(_backends['local'])
+        return _backends[name]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket throttle of a view. The view names its bucket with
+    throttle_scope, the rate comes from DEFAULT_THROTTLE_RATES under
+    "<scope><rate_suffix>", and throttle_backend ('local' or 'redis')
+    overrides THROTTLE_BACKEND. A scope without a rate is not throttled.
+    DRF checks throttles before the handler runs, so a refused request
+    costs one bucket update and no query.
+    """
+    rate_suffix = ''
+    kind = None
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_bucket_ident(self, request, view):
+        raise NotImplementedError('.get_bucket_ident() must be overridden')
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if not settings.THROTTLE_ENABLED or scope is None:
+            return True
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope + self.rate_suffix)
+        if rate is None:
+            return True
+        ident = self.get_bucket_ident(request, view)
+        if ident is None:
+            return True
+
+        capacity, refill = parse_rate(rate)
+        backend = get_backend(getattr(view, 'throttle_backend', None) or settings.THROTTLE_BACKEND)
+        key = 'throttle:%s:%s:%s' % (scope, self.kind, ident)
+        allowed, self.retry_after = backend.take(key, capacity, refill)
+        if not allowed:
+            metrics.THROTTLED.inc((scope, self.kind))
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class IPThrottle(TokenBucketThrottle):
+    """
+    Bucket per client address, REMOTE_ADDR or, behind NUM_PROXIES proxies,
+    the address the outermost of them saw in X-Forwarded-For.
+    """
+    kind = 'ip'
+
+    def get_bucket_ident(self, request, view):
+        return self.get_ident(request)
+
+
+class KeyThrottle(TokenBucketThrottle):
+    """
+    Bucket per value of the request field named by the view's
+    throttle_key_field (username, email, code) and client address, a
+    tighter limit than IPThrottle on retries of one value. Keyed on the
+    address too, so nobody can lock a known username out of login from
+    elsewhere. The rate is "<scope>_key".
+    """
+    rate_suffix = '_key'
+    kind = 'key'
+
+    def get_bucket_ident(self, request, view):
+        field = getattr(view, 'throttle_key_field', None)
+        value = request.data.get(field) if field is not None and hasattr(request.data, 'get') else None
+        if not isinstance(value, str) or not value.strip():
+            return None
+        # hashed, the field is user input of any length
+        raw = '%s|%s' % (value.strip().lower(), self.get_ident(request))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
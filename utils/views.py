@@ -0,0 +1,41 @@
+from django.conf import settings
+from rest_framework import generics, status
+from rest_framework.response import Response
+
+from utils import bloom, permissions
+from utils.slowqueries import store
+
+# Kept apart from utils.slowqueries: utils.db.aio records slow queries and
+# is imported by utils.pagination while rest_framework.generics loads.
+
+
+class SlowQueryListView(generics.GenericAPIView):
+    """Slowest statement fingerprints of this process by total time. DELETE clears them."""
+    permission_classes = [permissions.IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 20
+        data = []
+        for entry in store.top(limit):
+            entry.pop('explained_at')
+            entry['avg_ms'] = round(entry['total_time'] / entry['count'] * 1000, 2)
+            entry['total_ms'] = round(entry.pop('total_time') * 1000, 2)
+            entry['max_ms'] = round(entry.pop('max_time') * 1000, 2)
+            data.append(entry)
+        return Response(data={'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS, 'queries': data},
+                        status=status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        store.clear()
+        return Response(data={'cleared': True}, status=status.HTTP_200_OK)
+
+
+class MembershipFilterStatsView(generics.GenericAPIView):
+    """Size, memory, expected and observed false positive rates of the bloom filters."""
+    permission_classes = [permissions.IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=bloom.get_stats(), status=status.HTTP_200_OK)